@@ -0,0 +1,390 @@
+"""
+
+ OMRChecker synthetic sheets
+
+ Renders filled sheets from the bubble layout of a template.json along with
+ the ground truth responses, for load testing and accuracy checks.
+
+ Usage: python3 -m benchmarks.generate_sheets -t samples/sample1/template.json -n 1000 -o outputs/synthetic
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Note: the generator runs offline, without any monitor or GUI
+os.environ.setdefault("OMR_CHECKER_CONTAINER", "1")
+
+from src import constants  # noqa: E402
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.logger import logger  # noqa: E402
+from src.template import Template  # noqa: E402
+from src.utils.file import load_json  # noqa: E402
+from src.utils.parsing import (  # noqa: E402
+    get_concatenated_response,
+    open_config_with_defaults,
+)
+
+GROUND_TRUTH_FILENAME = "GroundTruth.csv"
+MARKER_FILENAME = "omr_marker.jpg"
+SHEETS_DIRNAME = "sheets"
+# Width of the page relative to the width of a corner marker
+SHEET_TO_MARKER_WIDTH_RATIO = 17
+PAGE_COLOR = 245
+BUBBLE_OUTLINE_COLOR = 120
+
+
+def parse_args():
+    argparser = argparse.ArgumentParser(prog="python3 -m benchmarks.generate_sheets")
+
+    argparser.add_argument(
+        "-t",
+        "--template",
+        required=True,
+        type=Path,
+        dest="template_path",
+        help="Template whose layout is rendered, its config.json is used if present.",
+    )
+
+    argparser.add_argument(
+        "-n",
+        "--count",
+        default=100,
+        type=int,
+        dest="count",
+        help="Number of sheets to generate.",
+    )
+
+    argparser.add_argument(
+        "-o",
+        "--outputDir",
+        required=True,
+        type=Path,
+        dest="output_dir",
+        help="Directory to write the template, the sheets and the ground truth into.",
+    )
+
+    argparser.add_argument(
+        "-m",
+        "--markers",
+        dest="markers",
+        action="store_true",
+        help="Draw corner markers and crop on them using the CropOnMarkers pre-processor.",
+    )
+
+    argparser.add_argument(
+        "--noise",
+        default=8.0,
+        type=float,
+        dest="noise",
+        help="Standard deviation of the gaussian pixel noise.",
+    )
+
+    argparser.add_argument(
+        "--rotation",
+        default=0.0,
+        type=float,
+        dest="rotation",
+        help="Maximum rotation of a sheet in degrees.",
+    )
+
+    argparser.add_argument(
+        "--scaleJitter",
+        default=0.0,
+        type=float,
+        dest="scale_jitter",
+        help="Maximum relative change in the scale of a sheet, e.g. 0.05.",
+    )
+
+    argparser.add_argument(
+        "--emptyProbability",
+        default=0.1,
+        type=float,
+        dest="empty_probability",
+        help="Probability of leaving a field unmarked.",
+    )
+
+    argparser.add_argument(
+        "--multiMarkProbability",
+        default=0.0,
+        type=float,
+        dest="multi_mark_probability",
+        help="Probability of marking two bubbles of a field.",
+    )
+
+    argparser.add_argument(
+        "--seed",
+        default=0,
+        type=int,
+        dest="seed",
+        help="Seed of the random generator, the same seed generates the same sheets.",
+    )
+
+    return vars(argparser.parse_args())
+
+
+class SheetGenerator:
+    """Renders random filled sheets for the bubble layout of a template.
+
+    The page is drawn at the template's pageDimensions. With markers, the page
+    is padded to the aspect ratio of the processing dimensions and a marker is
+    centred on each of its corners, so that cropping on the markers gives back
+    the page.
+    """
+
+    def __init__(
+        self,
+        template,
+        tuning_config,
+        markers=False,
+        noise=8.0,
+        rotation=0.0,
+        scale_jitter=0.0,
+        empty_probability=0.1,
+        multi_mark_probability=0.0,
+        seed=0,
+    ):
+        self.template = template
+        self.markers = markers
+        self.noise = noise
+        self.rotation = rotation
+        self.scale_jitter = scale_jitter
+        self.empty_probability = empty_probability
+        self.multi_mark_probability = multi_mark_probability
+        self.rng = np.random.default_rng(seed)
+        self.page_width, self.page_height = template.page_dimensions
+        self.blank_sheet = self.get_blank_sheet(tuning_config)
+
+    def get_blank_sheet(self, tuning_config):
+        page = np.full((self.page_height, self.page_width), PAGE_COLOR, np.uint8)
+        for field_block in self.template.field_blocks:
+            box_w, box_h = field_block.bubble_dimensions
+            radius = max(1, min(box_w, box_h) // 2 - 2)
+            for x, y in field_block.bubble_coords.reshape(-1, 2).tolist():
+                cv2.circle(
+                    page,
+                    (x + box_w // 2, y + box_h // 2),
+                    radius,
+                    BUBBLE_OUTLINE_COLOR,
+                    2,
+                    cv2.LINE_AA,
+                )
+        self.page_origin = (0, 0)
+        if not self.markers:
+            return page
+
+        self.marker_size = self.page_width // SHEET_TO_MARKER_WIDTH_RATIO
+        # Keep the markers within the sheet after rotating and scaling it
+        max_corner_shift = (
+            np.hypot(self.page_width, self.page_height)
+            / 2
+            * (np.radians(self.rotation) + self.scale_jitter)
+        )
+        margin = self.marker_size + int(max_corner_shift)
+        sheet_width = self.page_width + 2 * margin
+        sheet_height = self.page_height + 2 * margin
+        # Pad to the aspect ratio of the processing dimensions to not distort
+        # the markers when resizing
+        processing_aspect = (
+            tuning_config.dimensions.processing_height
+            / tuning_config.dimensions.processing_width
+        )
+        if sheet_height / sheet_width < processing_aspect:
+            sheet_height = int(sheet_width * processing_aspect)
+        else:
+            sheet_width = int(sheet_height / processing_aspect)
+        self.sheet_width = sheet_width
+        x, y = (
+            (sheet_width - self.page_width) // 2,
+            (sheet_height - self.page_height) // 2,
+        )
+        self.page_origin = (x, y)
+        sheet = np.full((sheet_height, sheet_width), PAGE_COLOR, np.uint8)
+        sheet[y : y + self.page_height, x : x + self.page_width] = page
+
+        marker = self.get_marker()
+        half_size = self.marker_size // 2
+        for corner_x, corner_y in [
+            (x, y),
+            (x + self.page_width, y),
+            (x, y + self.page_height),
+            (x + self.page_width, y + self.page_height),
+        ]:
+            sheet[
+                corner_y - half_size : corner_y - half_size + self.marker_size,
+                corner_x - half_size : corner_x - half_size + self.marker_size,
+            ] = marker
+        return sheet
+
+    def get_marker(self):
+        size = self.marker_size
+        marker = np.full((size, size), PAGE_COLOR, np.uint8)
+        centre = (size // 2, size // 2)
+        cv2.circle(marker, centre, int(size * 0.45), 0, -1, cv2.LINE_AA)
+        cv2.circle(marker, centre, int(size * 0.3), PAGE_COLOR, -1, cv2.LINE_AA)
+        cv2.circle(marker, centre, int(size * 0.15), 0, -1, cv2.LINE_AA)
+        return marker
+
+    def get_pre_processors(self):
+        if not self.markers:
+            return []
+        # Note: the marker is matched at or below its size, leave room for the
+        # sheets scaled up by the jitter
+        marker_width_ratio = int(
+            self.sheet_width / (self.marker_size * (1 + self.scale_jitter))
+        )
+        return [
+            {
+                "name": "CropOnMarkers",
+                "options": {
+                    "relativePath": MARKER_FILENAME,
+                    "sheetToMarkerWidthRatio": marker_width_ratio,
+                },
+            }
+        ]
+
+    def get_random_response(self):
+        """Returns the marked bubble coordinates and the response per field label"""
+        rng = self.rng
+        marked_coords, omr_response = [], {}
+        for field_block in self.template.field_blocks:
+            empty_val = field_block.empty_val
+            for field_label, field_coords in zip(
+                field_block.parsed_field_labels, field_block.bubble_coords
+            ):
+                if rng.random() < self.empty_probability:
+                    omr_response[field_label] = empty_val
+                    continue
+                marks_count = 2 if rng.random() < self.multi_mark_probability else 1
+                bubble_indices = sorted(
+                    rng.choice(
+                        len(field_block.bubble_values),
+                        size=min(marks_count, len(field_block.bubble_values)),
+                        replace=False,
+                    )
+                )
+                omr_response[field_label] = "".join(
+                    str(field_block.bubble_values[index]) for index in bubble_indices
+                )
+                marked_coords.extend(
+                    (field_coords[index], field_block.bubble_dimensions)
+                    for index in bubble_indices
+                )
+        return marked_coords, omr_response
+
+    def generate(self):
+        """Returns a random sheet image and its concatenated ground truth response"""
+        rng = self.rng
+        marked_coords, omr_response = self.get_random_response()
+        sheet = self.blank_sheet.copy()
+        origin_x, origin_y = self.page_origin
+        for (x, y), (box_w, box_h) in marked_coords:
+            radius = max(1, min(box_w, box_h) // 2 - 2)
+            # Hand-filled marks vary in darkness, size and position
+            centre = (
+                int(origin_x + x + box_w // 2 + rng.integers(-2, 3)),
+                int(origin_y + y + box_h // 2 + rng.integers(-2, 3)),
+            )
+            cv2.circle(
+                sheet,
+                centre,
+                int(radius * rng.uniform(0.75, 1.0)),
+                int(rng.integers(20, 80)),
+                -1,
+                cv2.LINE_AA,
+            )
+
+        if self.rotation > 0 or self.scale_jitter > 0:
+            h, w = sheet.shape[:2]
+            transform = cv2.getRotationMatrix2D(
+                (w / 2, h / 2),
+                rng.uniform(-self.rotation, self.rotation),
+                1 + rng.uniform(-self.scale_jitter, self.scale_jitter),
+            )
+            sheet = cv2.warpAffine(
+                sheet,
+                transform,
+                (w, h),
+                flags=cv2.INTER_LINEAR,
+                borderValue=PAGE_COLOR,
+            )
+        if self.noise > 0:
+            noise = rng.normal(0, self.noise, sheet.shape)
+            sheet = np.clip(sheet + noise, 0, 255).astype(np.uint8)
+
+        return sheet, get_concatenated_response(omr_response, self.template)
+
+
+def generate_sheets(
+    template_path,
+    count,
+    output_dir,
+    **generator_options,
+):
+    """Writes a template, `count` sheets and their ground truth into output_dir"""
+    template_path = Path(template_path)
+    config_path = template_path.parent.joinpath(constants.CONFIG_FILENAME)
+    tuning_config = (
+        open_config_with_defaults(config_path)
+        if os.path.exists(config_path)
+        else CONFIG_DEFAULTS
+    )
+    template = Template(template_path, tuning_config)
+    generator = SheetGenerator(template, tuning_config, **generator_options)
+
+    output_dir = Path(output_dir)
+    sheets_dir = output_dir.joinpath(SHEETS_DIRNAME)
+    os.makedirs(sheets_dir, exist_ok=True)
+
+    # The generated sheets are already cropped to the page, or have markers
+    template_json = load_json(template_path)
+    template_json["preProcessors"] = generator.get_pre_processors()
+    with open(output_dir.joinpath(constants.TEMPLATE_FILENAME), "w") as f:
+        json.dump(template_json, f, indent=2)
+    if os.path.exists(config_path):
+        shutil.copyfile(config_path, output_dir.joinpath(constants.CONFIG_FILENAME))
+    if generator.markers:
+        cv2.imwrite(str(output_dir.joinpath(MARKER_FILENAME)), generator.get_marker())
+
+    ground_truth_path = output_dir.joinpath(GROUND_TRUTH_FILENAME)
+    with open(ground_truth_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_id"] + template.output_columns)
+        for index in range(count):
+            sheet, response = generator.generate()
+            file_id = f"sheet_{index:06d}.jpg"
+            cv2.imwrite(str(sheets_dir.joinpath(file_id)), sheet)
+            writer.writerow(
+                [file_id] + [response[column] for column in template.output_columns]
+            )
+    logger.info(
+        f"Generated {count} sheets in '{sheets_dir}' with the ground truth in '{ground_truth_path}'"
+    )
+    return sheets_dir, ground_truth_path
+
+
+def main():
+    args = parse_args()
+    generate_sheets(
+        args["template_path"],
+        args["count"],
+        args["output_dir"],
+        markers=args["markers"],
+        noise=args["noise"],
+        rotation=args["rotation"],
+        scale_jitter=args["scale_jitter"],
+        empty_probability=args["empty_probability"],
+        multi_mark_probability=args["multi_mark_probability"],
+        seed=args["seed"],
+    )
+
+
+if __name__ == "__main__":
+    main()
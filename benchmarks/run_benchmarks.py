@@ -0,0 +1,381 @@
+"""
+
+ OMRChecker benchmarks
+
+ Runs the bundled samples and a synthetic batch through the entry point,
+ reports the throughput and stage latencies and compares them with a baseline.
+
+ Usage: python3 -m benchmarks [--samples sample1 sample4] [--baseline path]
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from unittest import mock
+
+import numpy as np
+
+# Note: the benchmarks run offline, without any monitor or GUI
+os.environ.setdefault("OMR_CHECKER_CONTAINER", "1")
+
+from rich.table import Table  # noqa: E402
+
+from benchmarks.generate_sheets import generate_sheets  # noqa: E402
+from main import entry_point_for_args  # noqa: E402
+from src.logger import console, logger  # noqa: E402
+from src.utils.timing import PERCENTILES, STAGE_TIMINGS, StageTimings  # noqa: E402
+
+SAMPLES_DIR = Path("samples")
+DEFAULT_BASELINE_PATH = Path("benchmarks", "baseline.json")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+SYNTHETIC_BENCHMARK = "synthetic"
+# Differences of the stage latencies below this are treated as noise
+MIN_REGRESSION_MS = 1.0
+
+
+def parse_args():
+    argparser = argparse.ArgumentParser(prog="python3 -m benchmarks")
+
+    argparser.add_argument(
+        "-s",
+        "--samples",
+        default=None,
+        nargs="*",
+        dest="samples",
+        help="Sample directories to run, relative to 'samples/'. Defaults to all samples.",
+    )
+
+    argparser.add_argument(
+        "-n",
+        "--syntheticCount",
+        default=100,
+        type=int,
+        dest="synthetic_count",
+        help="Number of sheets in the synthetic batch, 0 to skip it.",
+    )
+
+    argparser.add_argument(
+        "--syntheticSample",
+        default="sample1",
+        dest="synthetic_sample",
+        help="Sample whose images are replicated into the synthetic batch.",
+    )
+
+    argparser.add_argument(
+        "--syntheticTemplate",
+        default=None,
+        type=Path,
+        dest="synthetic_template",
+        help="Generate the synthetic batch from this template.json instead, \
+        as sheets with random marks, noise, rotation and corner markers.",
+    )
+
+    argparser.add_argument(
+        "--repeat",
+        default=1,
+        type=int,
+        dest="repeat",
+        help="Number of times to run each benchmark.",
+    )
+
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        default=1,
+        type=int,
+        dest="workers",
+        help="Number of worker processes, passed to the entry point.",
+    )
+
+    argparser.add_argument(
+        "--headless",
+        dest="headless",
+        action="store_true",
+        help="Run the entry point in the headless mode, without any output images.",
+    )
+
+    argparser.add_argument(
+        "-b",
+        "--baseline",
+        default=DEFAULT_BASELINE_PATH,
+        type=Path,
+        dest="baseline_path",
+        help="Baseline json to compare the results with.",
+    )
+
+    argparser.add_argument(
+        "--saveBaseline",
+        dest="save_baseline",
+        action="store_true",
+        help="Save the results as the new baseline instead of comparing with it.",
+    )
+
+    argparser.add_argument(
+        "--tolerance",
+        default=0.2,
+        type=float,
+        dest="tolerance",
+        help="Relative slowdown beyond which a metric is flagged as a regression.",
+    )
+
+    argparser.add_argument(
+        "-o",
+        "--outputFile",
+        default=None,
+        dest="output_file",
+        help="Save the results of this run into a json file.",
+    )
+
+    return vars(argparser.parse_args())
+
+
+def stub_gui():
+    """Stubs the GUI calls the same way as the tests do"""
+    patches = [
+        mock.patch("cv2.imshow", return_value=True),
+        mock.patch("cv2.destroyAllWindows", return_value=True),
+        mock.patch("cv2.waitKey", return_value=ord("q")),
+    ]
+    for patch in patches:
+        patch.start()
+    return patches
+
+
+def get_sample_names():
+    return sorted(d.name for d in SAMPLES_DIR.iterdir() if d.is_dir())
+
+
+def setup_synthetic_batch(sample_name, count, batch_dir):
+    """Copies a sample and replicates its sheets until the batch has `count` sheets.
+
+    Only the images in the subdirectories are replicated, as the images at the
+    root of a sample are the template assets (e.g. the omr markers).
+    """
+    sample_dir = SAMPLES_DIR.joinpath(sample_name)
+    shutil.copytree(sample_dir, batch_dir)
+    sheet_paths = sorted(
+        path
+        for path in batch_dir.rglob("*")
+        if path.suffix.lower() in IMAGE_EXTENSIONS and path.parent != batch_dir
+    )
+    if not sheet_paths:
+        raise Exception(f"No sheets found in the subdirectories of '{sample_dir}'")
+    for index in range(count - len(sheet_paths)):
+        sheet_path = sheet_paths[index % len(sheet_paths)]
+        shutil.copyfile(
+            sheet_path,
+            sheet_path.with_name(f"{sheet_path.stem}_copy{index}{sheet_path.suffix}"),
+        )
+    # Note: with fewer sheets than the sample, the batch has all the sample sheets
+    return batch_dir
+
+
+def run_benchmark(input_path, output_dir, repeat, entry_args):
+    args = {
+        "autoAlign": False,
+        "debug": False,
+        "input_paths": [str(input_path)],
+        "output_dir": str(output_dir),
+        "setLayout": False,
+        "silent": True,
+        **entry_args,
+    }
+    sheet_timings, wall_time = [], 0.0
+    for _ in range(repeat):
+        shutil.rmtree(output_dir, ignore_errors=True)
+        start = perf_counter()
+        entry_point_for_args(args)
+        wall_time += perf_counter() - start
+        sheet_timings.extend(STAGE_TIMINGS.sheet_timings)
+
+    benchmark_timings = StageTimings()
+    benchmark_timings.sheet_timings = sheet_timings
+    latencies_ms = np.array(
+        [sum(timings.values()) * 1000 for _, timings in sheet_timings]
+    )
+    return {
+        "sheets": len(sheet_timings),
+        "wall_time": wall_time,
+        "throughput": len(sheet_timings) / wall_time,
+        "latency": {
+            f"p{percentile}": float(value)
+            for percentile, value in zip(
+                PERCENTILES,
+                np.percentile(latencies_ms, PERCENTILES) if len(latencies_ms) else [],
+            )
+        },
+        "stages": benchmark_timings.get_summary(),
+    }
+
+
+def run_benchmarks(args):
+    sample_names = args["samples"] or get_sample_names()
+    entry_args = {"headless": args["headless"], "workers": args["workers"]}
+    patches = stub_gui()
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        for sample_name in sample_names:
+            logger.info(f"Benchmarking '{sample_name}'")
+            results[sample_name] = run_benchmark(
+                SAMPLES_DIR.joinpath(sample_name),
+                work_dir.joinpath("outputs", sample_name),
+                args["repeat"],
+                entry_args,
+            )
+        if args["synthetic_count"] > 0:
+            logger.info(
+                f"Benchmarking a synthetic batch of {args['synthetic_count']} sheets"
+            )
+            batch_dir = work_dir.joinpath(SYNTHETIC_BENCHMARK)
+            if args["synthetic_template"] is not None:
+                generate_sheets(
+                    args["synthetic_template"],
+                    args["synthetic_count"],
+                    batch_dir,
+                    markers=True,
+                    rotation=1.0,
+                    scale_jitter=0.02,
+                )
+            else:
+                setup_synthetic_batch(
+                    args["synthetic_sample"], args["synthetic_count"], batch_dir
+                )
+            results[SYNTHETIC_BENCHMARK] = run_benchmark(
+                batch_dir,
+                work_dir.joinpath("outputs", SYNTHETIC_BENCHMARK),
+                args["repeat"],
+                entry_args,
+            )
+    for patch in patches:
+        patch.stop()
+    return results
+
+
+def get_metrics(result):
+    """Returns {metric: (value, higher_is_better)} of a benchmark result"""
+    metrics = {"throughput (sheets/s)": (result["throughput"], True)}
+    for percentile, value in result["latency"].items():
+        metrics[f"latency {percentile} (ms)"] = (value, False)
+    for stage, statistics in result["stages"].items():
+        metrics[f"{stage} p50 (ms)"] = (statistics["p50"], False)
+    return metrics
+
+
+def is_regression(baseline_value, value, higher_is_better, tolerance):
+    if higher_is_better:
+        return value < baseline_value * (1 - tolerance)
+    return (
+        value > baseline_value * (1 + tolerance)
+        and value - baseline_value > MIN_REGRESSION_MS
+    )
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Returns the comparison rows and the list of regressed metrics"""
+    rows, regressions = [], []
+    for benchmark, result in results.items():
+        if benchmark not in baseline:
+            logger.warning(f"No baseline found for '{benchmark}'")
+            continue
+        baseline_metrics = get_metrics(baseline[benchmark])
+        for metric, (value, higher_is_better) in get_metrics(result).items():
+            if metric not in baseline_metrics:
+                continue
+            baseline_value = baseline_metrics[metric][0]
+            change = (value - baseline_value) / baseline_value if baseline_value else 0
+            regressed = is_regression(
+                baseline_value, value, higher_is_better, tolerance
+            )
+            if regressed:
+                regressions.append(f"{benchmark}: {metric}")
+            rows.append((benchmark, metric, baseline_value, value, change, regressed))
+    return rows, regressions
+
+
+def print_results(results):
+    table = Table(title="Benchmark Results", show_lines=False)
+    table.add_column("Benchmark", style="cyan", no_wrap=True)
+    table.add_column("Sheets", justify="right")
+    table.add_column("Wall Time (s)", justify="right")
+    table.add_column("Sheets/s", justify="right", style="magenta")
+    for percentile in PERCENTILES:
+        table.add_column(f"Latency p{percentile} (ms)", justify="right")
+    for benchmark, result in results.items():
+        table.add_row(
+            benchmark,
+            f"{result['sheets']}",
+            f"{round(result['wall_time'], 2)}",
+            f"{round(result['throughput'], 2)}",
+            *[
+                f"{round(result['latency'].get(f'p{percentile}', 0), 1)}"
+                for percentile in PERCENTILES
+            ],
+        )
+    console.print(table, justify="center")
+
+
+def print_comparison(rows):
+    table = Table(title="Comparison with Baseline", show_lines=False)
+    table.add_column("Benchmark", style="cyan", no_wrap=True)
+    table.add_column("Metric", no_wrap=True)
+    table.add_column("Baseline", justify="right")
+    table.add_column("Current", justify="right")
+    table.add_column("Change", justify="right")
+    table.add_column("Status", no_wrap=True)
+    for benchmark, metric, baseline_value, value, change, regressed in rows:
+        table.add_row(
+            benchmark,
+            metric,
+            f"{round(baseline_value, 2)}",
+            f"{round(value, 2)}",
+            f"{round(change * 100, 1)}%",
+            "[red]REGRESSED[/red]" if regressed else "[green]OK[/green]",
+        )
+    console.print(table, justify="center")
+
+
+def write_json(file_path, content):
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    with open(file_path, "w") as f:
+        json.dump(content, f, indent=2)
+
+
+def main():
+    args = parse_args()
+    results = run_benchmarks(args)
+    print_results(results)
+    if args["output_file"]:
+        write_json(args["output_file"], results)
+        logger.info(f"Saved the benchmark results to '{args['output_file']}'")
+
+    baseline_path = args["baseline_path"]
+    if args["save_baseline"]:
+        write_json(baseline_path, results)
+        logger.info(f"Saved the baseline to '{baseline_path}'")
+        return 0
+    if not os.path.exists(baseline_path):
+        logger.warning(
+            f"No baseline found at '{baseline_path}', create one using --saveBaseline"
+        )
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows, regressions = compare_with_baseline(results, baseline, args["tolerance"])
+    print_comparison(rows)
+    if regressions:
+        logger.error(f"Found {len(regressions)} regression(s) against the baseline")
+        return 1
+    logger.info("No regressions found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,7 @@ from pathlib import Path
 
 from src.entry import entry_point
 from src.logger import logger
+from src.utils.timing import STAGE_TIMINGS
 
 
 def parse_args():
@@ -69,6 +70,74 @@ def parse_args():
         run again until the template is set.",
     )
 
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        default=1,
+        required=False,
+        type=int,
+        dest="workers",
+        help="Number of worker processes to read the OMR sheets with.",
+    )
+
+    argparser.add_argument(
+        "-p",
+        "--prefetch",
+        default=0,
+        required=False,
+        type=int,
+        dest="prefetch",
+        help="Pipelined mode: number of sheets to decode ahead in background threads, \
+        while the results are written from a separate thread.",
+    )
+
+    argparser.add_argument(
+        "-s",
+        "--streamFiles",
+        default=0,
+        required=False,
+        type=int,
+        dest="stream_files",
+        help="Streaming mode: process the files of each directory in the listing \
+        order while it is being listed, keeping at most N listed files waiting.",
+    )
+
+    argparser.add_argument(
+        "-r",
+        "--resume",
+        required=False,
+        dest="resume",
+        action="store_true",
+        help="Resume an interrupted run, skipping the files already processed \
+        into the output directory.",
+    )
+
+    argparser.add_argument(
+        "--headless",
+        required=False,
+        dest="headless",
+        action="store_true",
+        help="Only compute the responses, without drawing, showing or saving \
+        any images. Overrides 'headless' of config.json.",
+    )
+
+    argparser.add_argument(
+        "-t",
+        "--timingsFile",
+        required=False,
+        dest="timings_file",
+        help="Save the per-sheet stage timings into a .json or .csv file.",
+    )
+
+    argparser.add_argument(
+        "-f",
+        "--resultsFormat",
+        required=False,
+        choices=["csv", "parquet"],
+        dest="results_format",
+        help="Format of the results files, overrides 'results_format' of config.json.",
+    )
+
     (
         args,
         unknown,
@@ -87,11 +156,16 @@ def entry_point_for_args(args):
     if args["debug"] is True:
         # Disable tracebacks
         sys.tracebacklimit = 0
+    STAGE_TIMINGS.reset()
     for root in args["input_paths"]:
         entry_point(
             Path(root),
             args,
         )
+    timings_file = args.get("timings_file")
+    if timings_file:
+        STAGE_TIMINGS.dump(timings_file)
+        logger.info(f"Saved stage timings to '{timings_file}'")
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ from dotmap import DotMap
 TEMPLATE_FILENAME = "template.json"
 EVALUATION_FILENAME = "evaluation.json"
 CONFIG_FILENAME = "config.json"
+MANIFEST_FILENAME = "Manifest.jsonl"
 
 FIELD_LABEL_NUMBER_REGEX = r"([^\d]+)(\d*)"
 #
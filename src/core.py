@@ -1,39 +1,53 @@
 import os
-from collections import defaultdict
-from typing import Any
+import threading
 
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 
 import src.constants as constants
 from src.logger import logger
-from src.utils.image import CLAHE_HELPER, ImageUtils
+from src.utils.image import (
+    CLAHE_HELPER,
+    AsyncImageWriter,
+    ImageUtils,
+    StageImageRecorder,
+    get_pyplot,
+)
 from src.utils.interaction import InteractionUtils
+from src.utils.timing import STAGE_TIMINGS
 
 
 class ImageInstanceOps:
     """Class to hold fine-tuned utilities for a group of images. One instance for each processing directory."""
 
-    save_img_list: Any = defaultdict(list)
-
     def __init__(self, tuning_config):
         super().__init__()
         self.tuning_config = tuning_config
         self.save_image_level = tuning_config.outputs.save_image_level
+        # Debug images of the sheet being read, one recorder per thread
+        self.thread_local = threading.local()
+        self.image_writer = AsyncImageWriter(
+            tuning_config.outputs.image_writer_threads,
+            tuning_config.outputs.jpeg_quality,
+            tuning_config.outputs.png_compression,
+        )
+        # Only compute the responses, skipping the marked image
+        self.headless = tuning_config.outputs.headless
 
     def apply_preprocessors(self, file_path, in_omr, template):
         tuning_config = self.tuning_config
         # resize to conform to template
-        in_omr = ImageUtils.resize_util(
-            in_omr,
-            tuning_config.dimensions.processing_width,
-            tuning_config.dimensions.processing_height,
-        )
+        with STAGE_TIMINGS.measure("resize"):
+            in_omr = ImageUtils.resize_util(
+                in_omr,
+                tuning_config.dimensions.processing_width,
+                tuning_config.dimensions.processing_height,
+            )
 
         # run pre_processors in sequence
         for pre_processor in template.pre_processors:
-            in_omr = pre_processor.apply_filter(in_omr, file_path)
+            with STAGE_TIMINGS.measure(pre_processor.__class__.__name__):
+                in_omr = pre_processor.apply_filter(in_omr, file_path)
         return in_omr
 
     def read_omr_response(self, template, image, name, save_dir=None):
@@ -47,13 +61,10 @@ class ImageInstanceOps:
             )
             if img.max() > img.min():
                 img = ImageUtils.normalize_util(img)
-            # Processing copies
-            transp_layer = img.copy()
-            final_marked = img.copy()
-
             morph = img.copy()
             self.append_save_img(3, morph)
 
+            STAGE_TIMINGS.start_lap()
             if auto_align:
                 # Note: clahe is good for morphology, bad for thresholding
                 morph = CLAHE_HELPER.apply(morph)
@@ -69,10 +80,6 @@ class ImageInstanceOps:
                 if config.outputs.show_image_level >= 4:
                     InteractionUtils.show("morph1", morph, 0, 1, config)
 
-            # Move them to data class if needed
-            # Overlay Transparencies
-            alpha = 0.65
-            omr_response = {}
             multi_marked, multi_roll = 0, 0
 
             # TODO Make this part useful for visualizing status checks
@@ -188,6 +195,7 @@ class ImageInstanceOps:
                     #   field_block.shift,", dimensions:", field_block.dimensions,
                     #   "origin:", field_block.origin,'\n')
                 # print("End Alignment")
+                STAGE_TIMINGS.lap("alignment")
 
             final_align = None
             if config.outputs.show_image_level >= 2:
@@ -201,34 +209,26 @@ class ImageInstanceOps:
 
                 if auto_align:
                     final_align = np.hstack((initial_align, final_align))
+                STAGE_TIMINGS.lap("drawing")
             self.append_save_img(5, img)
 
             # Get mean bubbleValues n other stats
-            all_q_vals, all_q_strip_arrs, all_q_std_vals = [], [], []
-            total_q_strip_no = 0
-            for field_block in template.field_blocks:
-                box_w, box_h = field_block.bubble_dimensions
-                q_std_vals = []
-                for field_block_bubbles in field_block.traverse_bubbles:
-                    q_strip_vals = []
-                    for pt in field_block_bubbles:
-                        # shifted
-                        x, y = (pt.x + field_block.shift, pt.y)
-                        rect = [y, y + box_h, x, x + box_w]
-                        q_strip_vals.append(
-                            cv2.mean(img[rect[0] : rect[1], rect[2] : rect[3]])[0]
-                            # detectCross(img, rect) ? 100 : 0
-                        )
-                    q_std_vals.append(round(np.std(q_strip_vals), 2))
-                    all_q_strip_arrs.append(q_strip_vals)
-                    # _, _, _ = get_global_threshold(q_strip_vals, "QStrip Plot",
-                    #   plot_show=False, sort_in_plot=True)
-                    # hist = getPlotImg()
-                    # InteractionUtils.show("QStrip "+field_block_bubbles[0].field_label, hist, 0, 1,config=config)
-                    all_q_vals.extend(q_strip_vals)
-                    # print(total_q_strip_no, field_block_bubbles[0].field_label, q_std_vals[len(q_std_vals)-1])
-                    total_q_strip_no += 1
-                all_q_std_vals.extend(q_std_vals)
+            compiled_layout = template.compiled_layout
+            strip_offsets = compiled_layout.strip_offsets.tolist()
+            bubble_means = self.get_bubble_means(img, template)
+            all_q_vals = bubble_means.tolist()
+            all_q_strip_arrs = [
+                all_q_vals[strip_start:strip_end]
+                for strip_start, strip_end in zip(strip_offsets[:-1], strip_offsets[1:])
+            ]
+            all_q_std_vals = [
+                round(np.std(q_strip_vals), 2) for q_strip_vals in all_q_strip_arrs
+            ]
+            STAGE_TIMINGS.lap("bubble_extraction")
+            # _, _, _ = get_global_threshold(q_strip_vals, "QStrip Plot",
+            #   plot_show=False, sort_in_plot=True)
+            # hist = getPlotImg()
+            # InteractionUtils.show("QStrip "+field_block_bubbles[0].field_label, hist, 0, 1,config=config)
 
             global_std_thresh, _, _ = self.get_global_threshold(
                 all_q_std_vals
@@ -256,126 +256,71 @@ class ImageInstanceOps:
             #     appendSaveImg(5,hist)
             #     appendSaveImg(2,hist)
 
-            per_omr_threshold_avg, total_q_strip_no, total_q_box_no = 0, 0, 0
-            for field_block in template.field_blocks:
-                block_q_strip_no = 1
-                box_w, box_h = field_block.bubble_dimensions
-                shift = field_block.shift
-                s, d = field_block.origin, field_block.dimensions
-                key = field_block.name[:3]
-                # cv2.rectangle(final_marked,(s[0]+shift,s[1]),(s[0]+shift+d[0],
-                #   s[1]+d[1]),CLR_BLACK,3)
-                for field_block_bubbles in field_block.traverse_bubbles:
-                    # All Black or All White case
-                    no_outliers = all_q_std_vals[total_q_strip_no] < global_std_thresh
-                    # print(total_q_strip_no, field_block_bubbles[0].field_label,
-                    #   all_q_std_vals[total_q_strip_no], "no_outliers:", no_outliers)
-                    per_q_strip_threshold = self.get_local_threshold(
-                        all_q_strip_arrs[total_q_strip_no],
-                        global_thr,
-                        no_outliers,
-                        f"Mean Intensity Histogram for {key}.{field_block_bubbles[0].field_label}.{block_q_strip_no}",
-                        config.outputs.show_image_level >= 6,
-                    )
-                    # print(field_block_bubbles[0].field_label,key,block_q_strip_no, "THR: ",
-                    #   round(per_q_strip_threshold,2))
-                    per_omr_threshold_avg += per_q_strip_threshold
-
-                    # Note: Little debugging visualization - view the particular Qstrip
-                    # if(
-                    #     0
-                    #     # or "q17" in (field_block_bubbles[0].field_label)
-                    #     # or (field_block_bubbles[0].field_label+str(block_q_strip_no))=="q15"
-                    #  ):
-                    #     st, end = qStrip
-                    #     InteractionUtils.show("QStrip: "+key+"-"+str(block_q_strip_no),
-                    #     img[st[1] : end[1], st[0]+shift : end[0]+shift],0,config=config)
-
-                    # TODO: get rid of total_q_box_no
-                    detected_bubbles = []
-                    for bubble in field_block_bubbles:
-                        bubble_is_marked = (
-                            per_q_strip_threshold > all_q_vals[total_q_box_no]
-                        )
-                        total_q_box_no += 1
-                        if bubble_is_marked:
-                            detected_bubbles.append(bubble)
-                            x, y, field_value = (
-                                bubble.x + field_block.shift,
-                                bubble.y,
-                                bubble.field_value,
-                            )
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 12), int(y + box_h / 12)),
-                                (
-                                    int(x + box_w - box_w / 12),
-                                    int(y + box_h - box_h / 12),
-                                ),
-                                constants.CLR_DARK_GRAY,
-                                3,
-                            )
+            strip_thresholds = self.get_local_thresholds(
+                compiled_layout.get_strip_matrix(bubble_means),
+                global_thr,
+                np.array(all_q_std_vals) < global_std_thresh,
+            )
+            per_omr_threshold_avg = np.mean(strip_thresholds)
 
-                            cv2.putText(
-                                final_marked,
-                                str(field_value),
-                                (x, y),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                constants.TEXT_SIZE,
-                                (20, 20, 10),
-                                int(1 + 3.5 * constants.TEXT_SIZE),
+            if config.outputs.show_image_level >= 5:
+                total_q_strip_no = 0
+                for field_block in template.field_blocks:
+                    key = field_block.name[:3]
+                    for block_q_strip_no, field_label in enumerate(
+                        field_block.parsed_field_labels, start=1
+                    ):
+                        if config.outputs.show_image_level >= 6:
+                            # All Black or All White case
+                            no_outliers = (
+                                all_q_std_vals[total_q_strip_no] < global_std_thresh
                             )
-                        else:
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 10), int(y + box_h / 10)),
-                                (
-                                    int(x + box_w - box_w / 10),
-                                    int(y + box_h - box_h / 10),
-                                ),
-                                constants.CLR_GRAY,
-                                -1,
+                            self.get_local_threshold(
+                                all_q_strip_arrs[total_q_strip_no],
+                                global_thr,
+                                no_outliers,
+                                f"Mean Intensity Histogram for {key}.{field_label}.{block_q_strip_no}",
                             )
 
-                    for bubble in detected_bubbles:
-                        field_label, field_value = (
-                            bubble.field_label,
-                            bubble.field_value,
-                        )
-                        # Only send rolls multi-marked in the directory
-                        multi_marked_local = field_label in omr_response
-                        omr_response[field_label] = (
-                            (omr_response[field_label] + field_value)
-                            if multi_marked_local
-                            else field_value
-                        )
-                        # TODO: generalize this into identifier
-                        # multi_roll = multi_marked_local and "Roll" in str(q)
-                        multi_marked = multi_marked or multi_marked_local
-
-                    if len(detected_bubbles) == 0:
-                        field_label = field_block_bubbles[0].field_label
-                        omr_response[field_label] = field_block.empty_val
+                        # Note: Little debugging visualization - view the particular Qstrip
+                        # if(
+                        #     0
+                        #     # or "q17" in (field_label)
+                        #     # or (field_label+str(block_q_strip_no))=="q15"
+                        #  ):
+                        #     st, end = qStrip
+                        #     InteractionUtils.show("QStrip: "+key+"-"+str(block_q_strip_no),
+                        #     img[st[1] : end[1], st[0]+shift : end[0]+shift],0,config=config)
 
-                    if config.outputs.show_image_level >= 5:
                         if key in all_c_box_vals:
                             q_nums[key].append(f"{key[:2]}_c{str(block_q_strip_no)}")
                             all_c_box_vals[key].append(
                                 all_q_strip_arrs[total_q_strip_no]
                             )
 
-                    block_q_strip_no += 1
-                    total_q_strip_no += 1
-                # /for field_block
+                        total_q_strip_no += 1
+                    # /for field_block
 
-            per_omr_threshold_avg /= total_q_strip_no
-            per_omr_threshold_avg = round(per_omr_threshold_avg, 2)
-            # Translucent
-            cv2.addWeighted(
-                final_marked, alpha, transp_layer, 1 - alpha, 0, final_marked
+            marked_bubbles = (
+                strip_thresholds[compiled_layout.field_indices] > bubble_means
             )
+            omr_response, multi_marked_local = self.get_marked_response(
+                compiled_layout, marked_bubbles
+            )
+            # TODO: generalize this into identifier
+            # multi_roll = multi_marked_local and "Roll" in str(q)
+            multi_marked = multi_marked or multi_marked_local
+            STAGE_TIMINGS.lap("thresholding")
+
+            per_omr_threshold_avg = round(per_omr_threshold_avg, 2)
+
+            final_marked = None
+            if not self.headless:
+                final_marked = self.draw_marked_image(img, template, marked_bubbles)
+                STAGE_TIMINGS.lap("drawing")
             # Box types
             if config.outputs.show_image_level >= 5:
+                plt = get_pyplot()
                 # plt.draw()
                 f, axes = plt.subplots(len(all_c_box_vals), sharey=True)
                 f.canvas.manager.set_window_title(name)
@@ -408,23 +353,141 @@ class ImageInstanceOps:
                     "Template Alignment Adjustment", final_align, 0, 0, config=config
                 )
 
-            if config.outputs.save_detections and save_dir is not None:
-                if multi_roll:
-                    save_dir = save_dir.joinpath("_MULTI_")
-                image_path = str(save_dir.joinpath(name))
-                ImageUtils.save_img(image_path, final_marked)
+            STAGE_TIMINGS.start_lap()
+            if final_marked is not None:
+                if config.outputs.save_detections and save_dir is not None:
+                    if multi_roll:
+                        save_dir = save_dir.joinpath("_MULTI_")
+                    image_path = str(save_dir.joinpath(name))
+                    self.image_writer.save_img(image_path, final_marked)
 
-            self.append_save_img(2, final_marked)
+                self.append_save_img(2, final_marked)
 
             if save_dir is not None:
                 for i in range(config.outputs.save_image_level):
                     self.save_image_stacks(i + 1, name, save_dir)
+            STAGE_TIMINGS.lap("saving")
 
             return omr_response, final_marked, multi_marked, multi_roll
 
         except Exception as e:
             raise e
 
+    @staticmethod
+    def get_shifted_coords(template):
+        compiled_layout = template.compiled_layout
+        shifts = np.array(
+            [[field_block.shift, 0] for field_block in template.field_blocks],
+            dtype=np.int32,
+        ).reshape(-1, 2)
+        return compiled_layout.coords + shifts[compiled_layout.block_indices]
+
+    @staticmethod
+    def get_bubble_means(img, template):
+        """Returns the mean intensity of all the bubbles (in traversal order) using
+        a summed-area table, instead of a cv2.mean() call per bubble"""
+        h, w = img.shape[:2]
+        compiled_layout = template.compiled_layout
+        if len(compiled_layout) == 0:
+            return np.zeros(0)
+        coords = ImageInstanceOps.get_shifted_coords(template)
+        dimensions = compiled_layout.block_dimensions[compiled_layout.block_indices]
+        x, y = coords[:, 0], coords[:, 1]
+        # Clip the (shifted) rects to the image, like the slices used to be
+        x1, x2 = np.clip(x, 0, w), np.clip(x + dimensions[:, 0], 0, w)
+        y1, y2 = np.clip(y, 0, h), np.clip(y + dimensions[:, 1], 0, h)
+
+        integral = cv2.integral(img, sdepth=cv2.CV_64F)
+        sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        areas = (x2 - x1) * (y2 - y1)
+        # Note: multiply by the reciprocal as cv2.mean() does, for identical results
+        scales = np.divide(1.0, areas, out=np.zeros(len(areas)), where=areas > 0)
+        return sums * scales
+
+    @staticmethod
+    def get_marked_response(compiled_layout, marked_bubbles):
+        """Returns the response of each field strip and whether any strip has
+        multiple marked bubbles"""
+        marked_indices = np.flatnonzero(marked_bubbles)
+        strip_responses = [[] for _ in compiled_layout.field_labels]
+        bubble_values = compiled_layout.bubble_values
+        for field_index, value_code in zip(
+            compiled_layout.field_indices[marked_indices].tolist(),
+            compiled_layout.value_codes[marked_indices].tolist(),
+        ):
+            strip_responses[field_index].append(bubble_values[value_code])
+
+        omr_response = {
+            field_label: "".join(strip_response) if strip_response else empty_val
+            for field_label, strip_response, empty_val in zip(
+                compiled_layout.field_labels,
+                strip_responses,
+                compiled_layout.empty_values,
+            )
+        }
+        marked_counts = np.bincount(
+            compiled_layout.field_indices[marked_indices],
+            minlength=len(compiled_layout.field_labels),
+        )
+        return omr_response, bool((marked_counts > 1).any())
+
+    def draw_marked_image(self, img, template, marked_bubbles):
+        """Returns a copy of the image with the marked bubbles overlaid"""
+        # Overlay Transparencies
+        alpha = 0.65
+        final_marked = img.copy()
+        self.draw_marked_bubbles(final_marked, template, marked_bubbles)
+        # Translucent, over the unmarked image
+        cv2.addWeighted(final_marked, alpha, img, 1 - alpha, 0, final_marked)
+        return final_marked
+
+    @staticmethod
+    def draw_marked_bubbles(final_marked, template, marked_bubbles):
+        compiled_layout = template.compiled_layout
+        coords = ImageInstanceOps.get_shifted_coords(template).tolist()
+        dimensions = compiled_layout.block_dimensions[
+            compiled_layout.block_indices
+        ].tolist()
+        bubble_values = compiled_layout.bubble_values
+        for (x, y), (box_w, box_h), value_code, bubble_is_marked in zip(
+            coords,
+            dimensions,
+            compiled_layout.value_codes.tolist(),
+            marked_bubbles.tolist(),
+        ):
+            if bubble_is_marked:
+                cv2.rectangle(
+                    final_marked,
+                    (int(x + box_w / 12), int(y + box_h / 12)),
+                    (
+                        int(x + box_w - box_w / 12),
+                        int(y + box_h - box_h / 12),
+                    ),
+                    constants.CLR_DARK_GRAY,
+                    3,
+                )
+
+                cv2.putText(
+                    final_marked,
+                    str(bubble_values[value_code]),
+                    (x, y),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    constants.TEXT_SIZE,
+                    (20, 20, 10),
+                    int(1 + 3.5 * constants.TEXT_SIZE),
+                )
+            else:
+                cv2.rectangle(
+                    final_marked,
+                    (int(x + box_w / 10), int(y + box_h / 10)),
+                    (
+                        int(x + box_w - box_w / 10),
+                        int(y + box_h - box_h / 10),
+                    ),
+                    constants.CLR_GRAY,
+                    -1,
+                )
+
     @staticmethod
     def draw_template_layout(img, template, shifted=True, draw_qvals=False, border=-1):
         img = ImageUtils.resize_util(
@@ -538,28 +601,27 @@ class ImageInstanceOps:
 
         # Sort the Q bubbleValues
         # TODO: Change var name of q_vals
-        q_vals = sorted(q_vals_orig)
+        q_vals = np.sort(np.asarray(q_vals_orig, dtype=np.float64))
         # Find the FIRST LARGE GAP and set it as threshold:
         ls = (looseness + 1) // 2
-        l = len(q_vals) - ls
+        # jumps[i - ls] = q_vals[i + ls] - q_vals[i - ls] for i in range(ls, l)
+        jumps = q_vals[2 * ls :] - q_vals[: max(0, len(q_vals) - 2 * ls)]
+        new_thrs = q_vals[: len(jumps)] + jumps / 2
         max1, thr1 = MIN_JUMP, global_default_threshold
-        for i in range(ls, l):
-            jump = q_vals[i + ls] - q_vals[i - ls]
-            if jump > max1:
-                max1 = jump
-                thr1 = q_vals[i - ls] + jump / 2
+        # Note: argmax picks the first of the largest jumps, like a strict '>' scan
+        if len(jumps) > 0 and jumps.max() > max1:
+            i = int(np.argmax(jumps))
+            max1, thr1 = float(jumps[i]), float(new_thrs[i])
 
         # NOTE: thr2 is deprecated, thus is JUMP_DELTA
         # Make use of the fact that the JUMP_DELTA(Vertical gap ofc) between
         # values at detected jumps would be atleast 20
         max2, thr2 = MIN_JUMP, global_default_threshold
         # Requires atleast 1 gray box to be present (Roll field will ensure this)
-        for i in range(ls, l):
-            jump = q_vals[i + ls] - q_vals[i - ls]
-            new_thr = q_vals[i - ls] + jump / 2
-            if jump > max2 and abs(thr1 - new_thr) > JUMP_DELTA:
-                max2 = jump
-                thr2 = new_thr
+        far_jumps = np.where(np.abs(thr1 - new_thrs) > JUMP_DELTA, jumps, -np.inf)
+        if len(far_jumps) > 0 and far_jumps.max() > max2:
+            i = int(np.argmax(far_jumps))
+            max2, thr2 = float(far_jumps[i]), float(new_thrs[i])
         # global_thr = min(thr1,thr2)
         global_thr, j_low, j_high = thr1, thr1 - max1 // 2, thr1 + max1 // 2
 
@@ -570,6 +632,7 @@ class ImageInstanceOps:
         #     global_thr, j_low, j_high = thr2, thr2 - max2//2, thr2 + max2//2
 
         if plot_title:
+            plt = get_pyplot()
             _, ax = plt.subplots()
             ax.bar(range(len(q_vals_orig)), q_vals if sort_in_plot else q_vals_orig)
             ax.set_title(plot_title)
@@ -675,6 +738,7 @@ class ImageInstanceOps:
 
         # Make a common plot function to show local and global thresholds
         if plot_show and plot_title is not None:
+            plt = get_pyplot()
             _, ax = plt.subplots()
             ax.bar(range(len(q_vals)), q_vals)
             thrline = ax.axhline(thr1, color="green", ls=("-."), linewidth=3)
@@ -691,31 +755,90 @@ class ImageInstanceOps:
                 plt.show()
         return thr1
 
+    def get_local_thresholds(self, strip_matrix, global_thr, no_outliers):
+        """
+        Batched version of get_local_threshold() for all the field strips at once.
+
+        strip_matrix is a (strips x bubbles) array padded with NaN for the strips
+        having fewer bubbles, and no_outliers is a boolean array per strip.
+        """
+        config = self.tuning_config
+        MIN_GAP, MIN_JUMP, CONFIDENT_SURPLUS = map(
+            config.threshold_params.get,
+            [
+                "MIN_GAP",
+                "MIN_JUMP",
+                "CONFIDENT_SURPLUS",
+            ],
+        )
+        # Sort the Q bubbleValues (NaN paddings are sorted to the end)
+        q_vals = np.sort(np.asarray(strip_matrix, dtype=np.float64), axis=1)
+        strips_count, max_len = q_vals.shape
+        strip_lengths = np.count_nonzero(~np.isnan(q_vals), axis=1)
+        strip_indices = np.arange(strips_count)
+
+        # Small no of pts cases: 1 or 2 pts
+        q_first = q_vals[:, 0] if max_len > 0 else np.full(strips_count, np.nan)
+        q_last = q_vals[strip_indices, np.maximum(strip_lengths - 1, 0)]
+        q_means = np.where(strip_lengths == 2, (q_first + q_last) / 2, q_first)
+        small_thrs = np.where(q_last - q_first < MIN_GAP, global_thr, q_means)
+
+        # Find the LARGEST GAP and set it as threshold: //(FIRST LARGE GAP)
+        # jumps[:, i - 1] = q_vals[:, i + 1] - q_vals[:, i - 1] for i in range(1, l)
+        jumps = q_vals[:, 2:] - q_vals[:, : max(0, max_len - 2)]
+        jump_valid = np.arange(jumps.shape[1]) < (strip_lengths - 2)[:, np.newaxis]
+        jumps = np.where(jump_valid, jumps, -np.inf)
+        if jumps.shape[1] > 0:
+            # Note: argmax picks the first of the largest jumps, like a strict '>' scan
+            best_jumps = np.argmax(jumps, axis=1)
+            max_jumps = jumps[strip_indices, best_jumps]
+            best_thrs = q_vals[strip_indices, best_jumps] + max_jumps / 2
+        else:
+            max_jumps = np.full(strips_count, -np.inf)
+            best_thrs = np.full(strips_count, 255.0)
+        has_jump = max_jumps > MIN_JUMP
+        max1 = np.where(has_jump, max_jumps, MIN_JUMP)
+        thr1 = np.where(has_jump, best_thrs, 255.0)
+
+        confident_jump = MIN_JUMP + CONFIDENT_SURPLUS
+        # If not confident, then only take help of global_thr
+        thr1 = np.where((max1 < confident_jump) & no_outliers, global_thr, thr1)
+
+        return np.where(strip_lengths < 3, small_thrs, thr1)
+
+    @property
+    def stage_images(self):
+        stage_images = getattr(self.thread_local, "stage_images", None)
+        if stage_images is None:
+            stage_images = StageImageRecorder(
+                self.save_image_level, self.tuning_config.dimensions.display_height
+            )
+            self.thread_local.stage_images = stage_images
+        return stage_images
+
     def append_save_img(self, key, img):
         if self.save_image_level >= int(key):
-            self.save_img_list[key].append(img.copy())
+            self.stage_images.record(key, img)
 
     def save_image_stacks(self, key, filename, save_dir):
         config = self.tuning_config
-        if self.save_image_level >= int(key) and self.save_img_list[key] != []:
+        if self.save_image_level < int(key):
+            return
+        stage_images = self.stage_images.get_images(key)
+        if stage_images:
             name = os.path.splitext(filename)[0]
-            result = np.hstack(
-                tuple(
-                    [
-                        ImageUtils.resize_util_h(img, config.dimensions.display_height)
-                        for img in self.save_img_list[key]
-                    ]
-                )
-            )
-            result = ImageUtils.resize_util(
-                result,
+            # Note: the recorded images are already resized to the display height,
+            # and are copied by stacking as their buffers are reused
+            self.image_writer.save_stack(
+                str(save_dir.joinpath("stack", f"{name}_{str(key)}_stack.jpg")),
+                np.hstack(stage_images),
                 min(
-                    len(self.save_img_list[key]) * config.dimensions.display_width // 3,
+                    len(stage_images) * config.dimensions.display_width // 3,
                     int(config.dimensions.display_width * 2.5),
                 ),
             )
-            ImageUtils.save_img(f"{save_dir}stack/{name}_{str(key)}_stack.jpg", result)
 
     def reset_all_save_img(self):
-        for i in range(self.save_image_level):
-            self.save_img_list[i + 1] = []
+        """Starts recording the debug images of a new sheet"""
+        if self.save_image_level > 0:
+            self.stage_images.start_sheet()
@@ -7,6 +7,8 @@ CONFIG_DEFAULTS = DotMap(
             "display_width": 1640,
             "processing_height": 820,
             "processing_width": 666,
+            # Note: 'reduced_decode' downscales large jpegs while decoding, down to at least the processing dimensions
+            "reduced_decode": True,
         },
         "threshold_params": {
             "GAMMA_LOW": 0.7,
@@ -29,6 +31,16 @@ CONFIG_DEFAULTS = DotMap(
             "save_image_level": 0,
             "save_detections": True,
             "filter_out_multimarked_files": False,
+            # Note: 'headless' only computes the responses, without showing or saving any images
+            "headless": False,
+            # Note: number of background threads writing the output images, 0 to write them synchronously
+            "image_writer_threads": 2,
+            "jpeg_quality": 95,
+            "png_compression": 3,
+            # Note: number of rows buffered before writing them to the results files
+            "results_batch_size": 100,
+            # Note: 'parquet' writes typed columns, it requires pyarrow
+            "results_format": "csv",
         },
     },
     _dynamic=False,
@@ -7,12 +7,15 @@
 
 """
 import os
-from csv import QUOTE_NONNUMERIC
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
-from time import time
+from queue import Queue
+from threading import Thread
+from time import perf_counter, time
 
 import cv2
-import pandas as pd
 from rich.table import Table
 
 from src import constants
@@ -20,10 +23,23 @@ from src.defaults import CONFIG_DEFAULTS
 from src.evaluation import EvaluationConfig, evaluate_concatenated_response
 from src.logger import console, logger
 from src.template import Template
-from src.utils.file import Paths, setup_dirs_for_paths, setup_outputs_for_template
+from src.utils.archive import ArchiveInput
+from src.utils.file import (
+    DirectoryListing,
+    Paths,
+    setup_dirs_for_paths,
+    setup_outputs_for_template,
+)
 from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils, Stats
-from src.utils.parsing import get_concatenated_response, open_config_with_defaults
+from src.utils.manifest import RunManifest
+from src.utils.parsing import (
+    get_concatenated_response,
+    get_headless_config,
+    open_config_with_defaults,
+)
+from src.utils.results import AsyncResultsWriter
+from src.utils.timing import STAGE_TIMINGS
 
 # Load processors
 STATS = Stats()
@@ -33,6 +49,13 @@ def entry_point(input_dir, args):
     if not os.path.exists(input_dir):
         raise Exception(f"Given input directory does not exist: '{input_dir}'")
     curr_dir = input_dir
+    if os.path.isfile(input_dir):
+        # Read the sheets directly from a zip or tar archive
+        archive = ArchiveInput(input_dir)
+        try:
+            return process_dir(input_dir, curr_dir, args, archive=archive)
+        finally:
+            archive.close()
     return process_dir(input_dir, curr_dir, args)
 
 
@@ -50,7 +73,10 @@ def print_config_summary(
     table.add_column("Key", style="cyan", no_wrap=True)
     table.add_column("Value", style="magenta")
     table.add_row("Directory Path", f"{curr_dir}")
-    table.add_row("Count of Images", f"{len(omr_files)}")
+    table.add_row(
+        "Count of Images",
+        f"{len(omr_files)}" if isinstance(omr_files, list) else "Streaming",
+    )
     table.add_row("Set Layout Mode ", "ON" if args["setLayout"] else "OFF")
     table.add_row(
         "Markers Detection",
@@ -77,56 +103,74 @@ def process_dir(
     template=None,
     tuning_config=CONFIG_DEFAULTS,
     evaluation_config=None,
+    archive=None,
 ):
+    # The json files of an archive are read from their extracted copies
+    local_dir = archive.get_local_dir(curr_dir) if archive else curr_dir
+
     # Update local tuning_config (in current recursion stack)
-    local_config_path = curr_dir.joinpath(constants.CONFIG_FILENAME)
+    local_config_path = local_dir.joinpath(constants.CONFIG_FILENAME)
     if os.path.exists(local_config_path):
         tuning_config = open_config_with_defaults(local_config_path)
+    if args.get("headless") and not tuning_config.outputs.headless:
+        tuning_config = get_headless_config(tuning_config)
 
     # Update local template (in current recursion stack)
-    local_template_path = curr_dir.joinpath(constants.TEMPLATE_FILENAME)
+    local_template_path = local_dir.joinpath(constants.TEMPLATE_FILENAME)
     local_template_exists = os.path.exists(local_template_path)
     if local_template_exists:
         template = Template(
             local_template_path,
             tuning_config,
         )
-    # Look for subdirectories for processing
-    subdirs = [d for d in curr_dir.iterdir() if d.is_dir()]
 
     output_dir = Path(args["output_dir"], curr_dir.relative_to(root_dir))
     paths = Paths(output_dir)
 
-    # look for images in current dir to process
-    exts = ("*.[pP][nN][gG]", "*.[jJ][pP][gG]", "*.[jJ][pP][eE][gG]")
-    omr_files = sorted([f for ext in exts for f in curr_dir.glob(ext)])
-
     # Exclude images (take union over all pre_processors)
-    excluded_files = []
+    excluded_files = set()
     if template:
         for pp in template.pre_processors:
-            excluded_files.extend(Path(p) for p in pp.exclude_files())
+            excluded_files.update(Path(p) for p in pp.exclude_files())
 
-    local_evaluation_path = curr_dir.joinpath(constants.EVALUATION_FILENAME)
+    local_evaluation_path = local_dir.joinpath(constants.EVALUATION_FILENAME)
     if not args["setLayout"] and os.path.exists(local_evaluation_path):
         if not local_template_exists:
             logger.warning(
                 f"Found an evaluation file without a parent template file: {local_evaluation_path}"
             )
         evaluation_config = EvaluationConfig(
-            curr_dir,
+            local_dir,
             local_evaluation_path,
             template,
             tuning_config,
         )
 
-        excluded_files.extend(
+        excluded_files.update(
             Path(exclude_file) for exclude_file in evaluation_config.get_exclude_files()
         )
 
-    omr_files = [f for f in omr_files if f not in excluded_files]
+    if archive:
+        excluded_files = {archive.get_input_path(f) for f in excluded_files}
+
+    # Look for images and subdirectories in current dir to process
+    listing = archive.get_listing(curr_dir) if archive else DirectoryListing(curr_dir)
+    stream_files = args.get("stream_files", 0)
+    if stream_files > 0:
+        # Start processing while the directory is still being listed
+        omr_files = (
+            f
+            for f in listing_in_thread(listing, stream_files)
+            if f not in excluded_files
+        )
+        has_omr_files, omr_files = peek_files(omr_files)
+    else:
+        omr_files = sorted(f for f in listing if f not in excluded_files)
+        has_omr_files = len(omr_files) > 0
+    # Note: the subdirectories are complete once the files are consumed
+    subdirs = listing.subdirs
 
-    if omr_files:
+    if has_omr_files:
         if not template:
             logger.error(
                 f"Found images, but no template in the directory tree \
@@ -138,7 +182,36 @@ def process_dir(
             )
 
         setup_dirs_for_paths(paths)
-        outputs_namespace = setup_outputs_for_template(paths, template)
+        manifest = None
+        manifest_path = paths.output_dir.joinpath(constants.MANIFEST_FILENAME)
+        resume = args.get("resume") and not args["setLayout"]
+        if resume and archive:
+            logger.warning("Resuming is not supported for archives, ignoring resume.")
+            resume = False
+        if resume:
+            # Note: loading the manifest also truncates the unfinished results
+            manifest = RunManifest(manifest_path)
+            if stream_files > 0:
+                omr_files = manifest.iter_pending_files(omr_files)
+                has_omr_files, omr_files = peek_files(omr_files)
+            else:
+                omr_files = manifest.get_pending_files(omr_files)
+                has_omr_files = len(omr_files) > 0
+        elif not args["setLayout"] and os.path.exists(manifest_path):
+            # Note: the rows of this run are not recorded in the manifest, resuming
+            # from its last checkpoint would truncate them
+            logger.info(f"Removing the manifest of a previous run: '{manifest_path}'")
+            os.remove(manifest_path)
+        results_format = (
+            args.get("results_format") or tuning_config.outputs.results_format
+        )
+        outputs_namespace = setup_outputs_for_template(
+            paths,
+            template,
+            tuning_config.outputs.results_batch_size,
+            results_format,
+            manifest,
+        )
 
         print_config_summary(
             curr_dir,
@@ -150,7 +223,13 @@ def process_dir(
             args,
         )
         if args["setLayout"]:
-            show_template_layouts(omr_files, template, tuning_config)
+            try:
+                show_template_layouts(omr_files, template, tuning_config, archive)
+            finally:
+                outputs_namespace.results_writer.close()
+        elif not has_omr_files:
+            logger.info(f"All the files in '{curr_dir}' are already processed.")
+            outputs_namespace.results_writer.close()
         else:
             process_files(
                 omr_files,
@@ -158,6 +237,9 @@ def process_dir(
                 tuning_config,
                 evaluation_config,
                 outputs_namespace,
+                workers=args.get("workers", 1),
+                prefetch=args.get("prefetch", 0),
+                archive=archive,
             )
 
     elif not subdirs:
@@ -176,14 +258,52 @@ def process_dir(
             template,
             tuning_config,
             evaluation_config,
+            archive,
         )
 
 
-def show_template_layouts(omr_files, template, tuning_config):
+def peek_files(omr_files):
+    """Returns whether the iterator has any file, and an iterator over all of its files"""
+    first_file = next(omr_files, None)
+    if first_file is None:
+        return False, iter(())
+    return True, chain([first_file], omr_files)
+
+
+def listing_in_thread(listing, max_in_flight):
+    """Lists the files in a background thread, yielding them in the listing order"""
+    # Keep at most `max_in_flight` listed files waiting to be processed
+    listed_files = Queue(maxsize=max_in_flight)
+    listing_errors = []
+
+    def list_files():
+        try:
+            for file_path in listing:
+                listed_files.put(file_path)
+        except Exception as error:
+            listing_errors.append(error)
+        finally:
+            listed_files.put(None)
+
+    thread = Thread(target=list_files, daemon=True)
+    thread.start()
+    file_path = listed_files.get()
+    while file_path is not None:
+        yield file_path
+        file_path = listed_files.get()
+    thread.join()
+    if listing_errors:
+        raise listing_errors[0]
+
+
+def show_template_layouts(omr_files, template, tuning_config, archive=None):
     for file_path in omr_files:
         file_name = file_path.name
+        in_omr = decode_omr_file(file_path, get_decode_size(tuning_config), archive)
+        if in_omr is None:
+            logger.error(f"Could not decode image: '{file_path}'")
+            continue
         file_path = str(file_path)
-        in_omr = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
         in_omr = template.image_instance_ops.apply_preprocessors(
             file_path, in_omr, template
         )
@@ -201,135 +321,322 @@ def process_files(
     tuning_config,
     evaluation_config,
     outputs_namespace,
+    workers=1,
+    prefetch=0,
+    archive=None,
 ):
     start_time = int(time())
+    timings_start = len(STAGE_TIMINGS.sheet_timings)
     files_counter = 0
     STATS.files_not_moved = 0
 
-    for file_path in omr_files:
-        files_counter += 1
-        file_name = file_path.name
-
-        in_omr = cv2.imread(str(file_path), cv2.IMREAD_GRAYSCALE)
+    if workers > 1 and tuning_config.outputs.show_image_level > 0:
+        logger.warning(
+            f"Showing images is not supported with {workers} workers, falling back to a single worker."
+        )
+        workers = 1
 
-        logger.info("")
+    if workers > 1 and prefetch > 0:
         logger.info(
-            f"({files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+            "Sheets are decoded within the worker processes, ignoring prefetch."
+        )
+        prefetch = 0
+
+    save_dir = outputs_namespace.paths.save_marked_dir
+    if workers > 1:
+        sheet_results = read_omr_files_in_pool(
+            omr_files, template, tuning_config, save_dir, workers, archive
+        )
+    elif prefetch > 0:
+        # Pipelined mode: decode ahead in threads, read here, write in a thread
+        sheet_results = (
+            read_omr_file(file_path, files_counter, template, save_dir, decoded)
+            for files_counter, (file_path, decoded) in enumerate(
+                decode_omr_files_in_threads(
+                    omr_files, prefetch, get_decode_size(tuning_config), archive
+                ),
+                start=1,
+            )
+        )
+    else:
+        sheet_results = (
+            read_omr_file(file_path, files_counter, template, save_dir, archive=archive)
+            for files_counter, file_path in enumerate(omr_files, start=1)
         )
 
-        template.image_instance_ops.reset_all_save_img()
+    results_writer = outputs_namespace.results_writer
+    if prefetch > 0:
+        results_writer = AsyncResultsWriter(results_writer)
+    try:
+        for files_counter, sheet_result in enumerate(sheet_results, start=1):
+            file_path, omr_response, final_marked, multi_marked = sheet_result
+            file_name = file_path.name
+
+            if omr_response is None:
+                # Error OMR case
+                new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
+                outputs_namespace.OUTPUT_SET.append(
+                    [file_name] + outputs_namespace.empty_resp
+                )
+                if check_and_move(
+                    constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path
+                ):
+                    err_line = [
+                        file_name,
+                        file_path,
+                        new_file_path,
+                        "NA",
+                    ] + outputs_namespace.empty_resp
+                    results_writer.write_row("Errors", err_line, file_path)
+                STAGE_TIMINGS.end_sheet()
+                continue
+
+            # uniquify
+            file_id = str(file_name)
+
+            if (
+                evaluation_config is None
+                or not evaluation_config.get_should_explain_scoring()
+            ):
+                logger.info(f"Read Response: \n{omr_response}")
+
+            score = 0
+            if evaluation_config is not None:
+                with STAGE_TIMINGS.measure("evaluation"):
+                    score = evaluate_concatenated_response(
+                        omr_response, evaluation_config
+                    )
+                logger.info(
+                    f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
+                )
+            else:
+                logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
+
+            if tuning_config.outputs.show_image_level >= 2:
+                InteractionUtils.show(
+                    f"Final Marked Bubbles : '{file_id}'",
+                    ImageUtils.resize_util_h(
+                        final_marked, int(tuning_config.dimensions.display_height * 1.3)
+                    ),
+                    1,
+                    1,
+                    config=tuning_config,
+                )
 
-        template.image_instance_ops.append_save_img(1, in_omr)
+            resp_array = []
+            for k in template.output_columns:
+                resp_array.append(omr_response[k])
 
-        in_omr = template.image_instance_ops.apply_preprocessors(
-            file_path, in_omr, template
-        )
+            outputs_namespace.OUTPUT_SET.append([file_name] + resp_array)
 
-        if in_omr is None:
-            # Error OMR case
-            new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
-            outputs_namespace.OUTPUT_SET.append(
-                [file_name] + outputs_namespace.empty_resp
-            )
-            if check_and_move(
-                constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path
+            if (
+                multi_marked == 0
+                or not tuning_config.outputs.filter_out_multimarked_files
             ):
-                err_line = [
-                    file_name,
-                    file_path,
-                    new_file_path,
-                    "NA",
-                ] + outputs_namespace.empty_resp
-                pd.DataFrame(err_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["Errors"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
+                STATS.files_not_moved += 1
+                new_file_path = save_dir.joinpath(file_id)
+                # Enter into Results sheet-
+                results_line = [file_name, file_path, new_file_path, score] + resp_array
+                # Append to the buffered results file
+                results_writer.write_row("Results", results_line, file_path)
+            else:
+                # multi_marked file
+                logger.info(f"[{files_counter}] Found multi-marked file: '{file_id}'")
+                new_file_path = outputs_namespace.paths.multi_marked_dir.joinpath(
+                    file_name
                 )
-            continue
+                if check_and_move(
+                    constants.ERROR_CODES.MULTI_BUBBLE_WARN, file_path, new_file_path
+                ):
+                    mm_line = [file_name, file_path, new_file_path, "NA"] + resp_array
+                    results_writer.write_row("MultiMarked", mm_line, file_path)
+                # else:
+                #     TODO:  Add appropriate record handling here
+                #     pass
+            STAGE_TIMINGS.end_sheet()
+    finally:
+        # Write the remaining buffered rows and the queued output images
+        results_writer.close()
+        template.image_instance_ops.image_writer.close()
 
-        # uniquify
-        file_id = str(file_name)
-        save_dir = outputs_namespace.paths.save_marked_dir
-        (
-            response_dict,
-            final_marked,
-            multi_marked,
-            _,
-        ) = template.image_instance_ops.read_omr_response(
-            template, image=in_omr, name=file_id, save_dir=save_dir
-        )
+    print_stats(start_time, files_counter, tuning_config)
+    STAGE_TIMINGS.print_summary(timings_start)
 
-        # TODO: move inner try catch here
-        # concatenate roll nos, set unmarked responses, etc
-        omr_response = get_concatenated_response(response_dict, template)
-
-        if (
-            evaluation_config is None
-            or not evaluation_config.get_should_explain_scoring()
-        ):
-            logger.info(f"Read Response: \n{omr_response}")
-
-        score = 0
-        if evaluation_config is not None:
-            score = evaluate_concatenated_response(omr_response, evaluation_config)
-            logger.info(
-                f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
-            )
-        else:
-            logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
 
-        if tuning_config.outputs.show_image_level >= 2:
-            InteractionUtils.show(
-                f"Final Marked Bubbles : '{file_id}'",
-                ImageUtils.resize_util_h(
-                    final_marked, int(tuning_config.dimensions.display_height * 1.3)
-                ),
-                1,
-                1,
-                config=tuning_config,
+def get_decode_size(tuning_config):
+    """Returns the smallest (width, height) to decode the sheets at, or None for full size"""
+    if not tuning_config.dimensions.reduced_decode:
+        return None
+    # Note: the sheets are resized to the processing dimensions before any processing
+    return (
+        tuning_config.dimensions.processing_width,
+        tuning_config.dimensions.processing_height,
+    )
+
+
+def decode_omr_file(file_path, decode_size=None, archive=None):
+    if archive is not None:
+        return decode_omr_data(archive.read(file_path), decode_size)
+    if decode_size is None:
+        return cv2.imread(str(file_path), cv2.IMREAD_GRAYSCALE)
+    with open(file_path, "rb") as f:
+        return decode_omr_data(f.read(), decode_size)
+
+
+def decode_omr_data(file_data, decode_size=None):
+    if decode_size is None:
+        return ImageUtils.decode_img(file_data)
+    return ImageUtils.decode_img(file_data, *decode_size)
+
+
+def timed_decode_omr_file(file_path, decode_size=None, archive=None):
+    start = perf_counter()
+    in_omr = decode_omr_file(file_path, decode_size, archive)
+    return in_omr, perf_counter() - start
+
+
+def decode_omr_files_in_threads(omr_files, prefetch, decode_size=None, archive=None):
+    """Decodes the sheets in a thread pool, yielding (file_path, decoded) in input order"""
+    # Keep at most `prefetch` decoded sheets waiting to limit memory usage
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = deque()
+        for file_path in omr_files:
+            pending.append(
+                (
+                    file_path,
+                    executor.submit(
+                        timed_decode_omr_file, file_path, decode_size, archive
+                    ),
+                )
             )
+            if len(pending) > prefetch:
+                decoded_path, future = pending.popleft()
+                yield decoded_path, future.result()
+        while pending:
+            decoded_path, future = pending.popleft()
+            yield decoded_path, future.result()
+
 
-        resp_array = []
-        for k in template.output_columns:
-            resp_array.append(omr_response[k])
-
-        outputs_namespace.OUTPUT_SET.append([file_name] + resp_array)
-
-        if multi_marked == 0 or not tuning_config.outputs.filter_out_multimarked_files:
-            STATS.files_not_moved += 1
-            new_file_path = save_dir.joinpath(file_id)
-            # Enter into Results sheet-
-            results_line = [file_name, file_path, new_file_path, score] + resp_array
-            # Write/Append to results_line file(opened in append mode)
-            pd.DataFrame(results_line, dtype=str).T.to_csv(
-                outputs_namespace.files_obj["Results"],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
+def read_omr_file(
+    file_path, files_counter, template, save_dir, decoded=None, archive=None
+):
+    """Reads the concatenated response of a single sheet, without evaluating or writing it"""
+    file_name = file_path.name
+
+    STAGE_TIMINGS.start_sheet(file_name)
+    if decoded is None:
+        with STAGE_TIMINGS.measure("decode"):
+            in_omr = decode_omr_file(
+                file_path,
+                get_decode_size(template.image_instance_ops.tuning_config),
+                archive,
             )
-        else:
-            # multi_marked file
-            logger.info(f"[{files_counter}] Found multi-marked file: '{file_id}'")
-            new_file_path = outputs_namespace.paths.multi_marked_dir.joinpath(file_name)
-            if check_and_move(
-                constants.ERROR_CODES.MULTI_BUBBLE_WARN, file_path, new_file_path
-            ):
-                mm_line = [file_name, file_path, new_file_path, "NA"] + resp_array
-                pd.DataFrame(mm_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["MultiMarked"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
-                )
-            # else:
-            #     TODO:  Add appropriate record handling here
-            #     pass
+    else:
+        # Decoded in advance (see decode_omr_files_in_threads)
+        in_omr, decode_time = decoded
+        STAGE_TIMINGS.add("decode", decode_time)
 
-    print_stats(start_time, files_counter, tuning_config)
+    logger.info("")
+    if in_omr is None:
+        logger.error(f"({files_counter}) Could not decode image: '{file_path}'")
+        return file_path, None, None, 0
+
+    logger.info(
+        f"({files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+    )
+
+    template.image_instance_ops.reset_all_save_img()
+
+    template.image_instance_ops.append_save_img(1, in_omr)
+
+    in_omr = template.image_instance_ops.apply_preprocessors(
+        file_path, in_omr, template
+    )
+
+    if in_omr is None:
+        return file_path, None, None, 0
+
+    # uniquify
+    file_id = str(file_name)
+    (
+        response_dict,
+        final_marked,
+        multi_marked,
+        _,
+    ) = template.image_instance_ops.read_omr_response(
+        template, image=in_omr, name=file_id, save_dir=save_dir
+    )
+
+    # TODO: move inner try catch here
+    # concatenate roll nos, set unmarked responses, etc
+    omr_response = get_concatenated_response(response_dict, template)
+
+    return file_path, omr_response, final_marked, multi_marked
+
+
+# Template of the current worker process (see read_omr_files_in_pool)
+WORKER_TEMPLATE = None
+
+
+def init_worker_template(template_path, tuning_config):
+    global WORKER_TEMPLATE
+    WORKER_TEMPLATE = Template(template_path, tuning_config)
+
+
+def read_omr_file_in_worker(file_path, files_counter, save_dir, file_data=None):
+    decoded = None
+    if file_data is not None:
+        # Read from an archive by the main process
+        start = perf_counter()
+        in_omr = decode_omr_data(
+            file_data, get_decode_size(WORKER_TEMPLATE.image_instance_ops.tuning_config)
+        )
+        decoded = in_omr, perf_counter() - start
+    file_path, omr_response, _final_marked, multi_marked = read_omr_file(
+        file_path, files_counter, WORKER_TEMPLATE, save_dir, decoded
+    )
+    # Note: the worker processes may exit without stopping the writer threads
+    WORKER_TEMPLATE.image_instance_ops.image_writer.flush()
+    # Note: the marked image is only needed for showing, skip sending it back
+    return file_path, omr_response, None, multi_marked, STAGE_TIMINGS.end_sheet()
+
+
+def get_worker_result(future):
+    *sheet_result, timings = future.result()
+    # Continue the sheet timings of the worker in the main process
+    file_path = sheet_result[0]
+    STAGE_TIMINGS.start_sheet(file_path.name, timings)
+    return tuple(sheet_result)
+
+
+def read_omr_files_in_pool(
+    omr_files, template, tuning_config, save_dir, workers, archive=None
+):
+    """Reads the sheets in a process pool, yielding the results in input order"""
+    # Keep a bounded number of sheets in flight to limit memory usage
+    max_pending = 2 * workers
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker_template,
+        initargs=(template.path, tuning_config),
+    ) as executor:
+        pending = deque()
+        for files_counter, file_path in enumerate(omr_files, start=1):
+            # Note: the archive is read here, as its file handle is not shareable
+            file_data = archive.read(file_path) if archive else None
+            pending.append(
+                executor.submit(
+                    read_omr_file_in_worker,
+                    file_path,
+                    files_counter,
+                    save_dir,
+                    file_data,
+                )
+            )
+            if len(pending) >= max_pending:
+                yield get_worker_result(pending.popleft())
+        while pending:
+            yield get_worker_result(pending.popleft())
 
 
 def check_and_move(error_code, file_path, filepath2):
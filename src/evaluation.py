@@ -4,7 +4,6 @@ import re
 from copy import deepcopy
 
 import cv2
-import pandas as pd
 from rich.table import Table
 
 from src.logger import console, logger
@@ -205,6 +204,9 @@ class EvaluationConfig:
 
             answer_key_image_path = options.get("answer_key_image_path", None)
             if os.path.exists(csv_path):
+                # Note: pandas is slow to import, and only needed for csv answer keys
+                import pandas as pd
+
                 # TODO: CSV parsing/validation for each row with a (qNo, <ans string/>) pair
                 answer_key = pd.read_csv(
                     csv_path,
@@ -6,58 +6,229 @@
  Github: https://github.com/Udayraj123
 
 """
+import hashlib
 import os
-from csv import QUOTE_NONNUMERIC
 from pathlib import Path
-from time import time
+from threading import Lock
 
-import cv2
-import pandas as pd
 from src import constants
-from src.evaluation import evaluate_concatenated_response
+from src.defaults import CONFIG_DEFAULTS
+from src.entry import check_and_move, decode_omr_data, get_decode_size
+from src.evaluation import EvaluationConfig, evaluate_concatenated_response
 from src.logger import logger
 from src.template import Template
+from src.utils.cache import ResponseCache
+from src.utils.file import (
+    Paths,
+    get_file_fingerprint,
+    setup_dirs_for_paths,
+    setup_outputs_for_template,
+)
 from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils, Stats
 from src.utils.parsing import get_concatenated_response, open_config_with_defaults
 
-from src.utils.file import Paths, setup_outputs_for_template
-
-from src.entry import check_and_move
-
 # Load processors
 STATS = Stats()
 
 
+class TemplateRegistryEntry:
+    def __init__(
+        self,
+        template,
+        tuning_config,
+        evaluation_config,
+        outputs_namespace,
+        file_stats,
+    ):
+        self.template = template
+        self.tuning_config = tuning_config
+        self.evaluation_config = evaluation_config
+        self.outputs_namespace = outputs_namespace
+        # Serializes the reads, as the template and the results writer are shared
+        self.lock = Lock()
+        # {file_path: (mtime_ns, size, sha256)} of the json files the entry is built from
+        self.file_stats = file_stats
+        # Identifies the template, config and evaluation contents together
+        file_hashes = [str(file_hash) for (_, _, file_hash) in file_stats.values()]
+        self.fingerprint = hashlib.sha256(":".join(file_hashes).encode()).hexdigest()
+        self.closed = False
+
+    def close(self):
+        """Releases the writers of a replaced entry, once its current read is done"""
+        with self.lock:
+            self.closed = True
+            try:
+                self.template.image_instance_ops.image_writer.close()
+            except Exception as error:
+                logger.warning(f"Failed to write the marked images: {error}")
+            self.outputs_namespace.results_writer.close()
+
+
+class TemplateRegistry:
+    """Process-wide cache of the built templates, keyed by template_id.
+
+    An entry is rebuilt when the content of its template, config or evaluation json
+    changes, which also invalidates its cached responses.
+    """
+
+    def __init__(self, curr_dir=Path(), output_dir=Path("output"), response_cache=None):
+        self.curr_dir = curr_dir
+        self.output_dir = output_dir
+        self.response_cache = response_cache
+        self.entries = {}
+        self.lock = Lock()
+
+    def get_json_paths(self, template_id):
+        if template_id is None:
+            template_path = constants.TEMPLATE_FILENAME
+            evaluation_path = constants.EVALUATION_FILENAME
+        else:
+            template_path = "templates/" + template_id + ".json"
+            evaluation_path = "evaluations/" + template_id + ".json"
+        return (
+            self.curr_dir.joinpath(template_path),
+            self.curr_dir.joinpath(constants.CONFIG_FILENAME),
+            self.curr_dir.joinpath(evaluation_path),
+        )
+
+    def get(self, template_id):
+        with self.lock:
+            entry = self.entries.get(template_id)
+            if entry is None or self.is_stale(entry):
+                if entry is not None:
+                    self.invalidate_cached_responses(entry)
+                    entry.close()
+                entry = self.build_entry(template_id)
+                self.entries[template_id] = entry
+            return entry
+
+    def invalidate(self, template_id=None):
+        with self.lock:
+            if template_id is None:
+                entries = list(self.entries.values())
+                self.entries.clear()
+            elif template_id in self.entries:
+                entries = [self.entries.pop(template_id)]
+            else:
+                entries = []
+            for entry in entries:
+                self.invalidate_cached_responses(entry)
+                entry.close()
+
+    def invalidate_cached_responses(self, entry):
+        if self.response_cache is not None:
+            self.response_cache.invalidate(entry.fingerprint)
+
+    @staticmethod
+    def is_stale(entry):
+        for file_path, (mtime_ns, size, file_hash) in entry.file_stats.items():
+            if not os.path.exists(file_path):
+                if file_hash is not None:
+                    return True
+                continue
+            stat = os.stat(file_path)
+            if (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+                continue
+            # Only hash the file when it was touched
+            if get_file_fingerprint(file_path) != file_hash:
+                return True
+            entry.file_stats[file_path] = (stat.st_mtime_ns, stat.st_size, file_hash)
+        return False
+
+    def build_entry(self, template_id):
+        template_path, config_path, evaluation_path = self.get_json_paths(template_id)
+        file_stats = {}
+        for file_path in [template_path, config_path, evaluation_path]:
+            if os.path.exists(file_path):
+                stat = os.stat(file_path)
+                file_stats[file_path] = (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    get_file_fingerprint(file_path),
+                )
+            else:
+                file_stats[file_path] = (None, None, None)
+
+        if os.path.exists(config_path):
+            tuning_config = open_config_with_defaults(config_path)
+        else:
+            tuning_config = CONFIG_DEFAULTS
+
+        template = Template(
+            template_path,
+            tuning_config,
+        )
+
+        evaluation_config = None
+        if os.path.exists(evaluation_path):
+            evaluation_config = EvaluationConfig(
+                self.curr_dir,
+                evaluation_path,
+                template,
+                tuning_config,
+            )
+
+        paths = Paths(self.output_dir)
+        setup_dirs_for_paths(paths)
+        # Note: results are flushed per request, no need to buffer them
+        outputs_namespace = setup_outputs_for_template(paths, template)
+
+        logger.info(f"Registered template '{template_id}' from '{template_path}'")
+        return TemplateRegistryEntry(
+            template, tuning_config, evaluation_config, outputs_namespace, file_stats
+        )
+
+
+# Singleton exports
+RESPONSE_CACHE = ResponseCache(Path("output", "ResponseCache"))
+TEMPLATE_REGISTRY = TemplateRegistry(response_cache=RESPONSE_CACHE)
+
+
 def process_and_get_result(
-        template_id,
-        file_data,
-        file_name,
+    template_id,
+    file_data,
+    file_name,
 ):
-    in_omr = cv2.imdecode(file_data, cv2.IMREAD_GRAYSCALE)
+    """Returns the omr_response of the image, or None when it could not be read"""
+    result = process_and_get_scored_result(template_id, file_data, file_name)
+    return None if result is None else result[0]
 
-    logger.info("")
-    logger.info(
-        f"Opening image: \t'{file_name}'\tResolution: {in_omr.shape}"
-    )
 
-    curr_dir = Path()
+def process_and_get_scored_result(template_id, file_data, file_name):
+    """Returns the (omr_response, score) of the image, or None when it could not be read.
 
-    # Update local tuning_config (in current recursion stack)
-    local_config_path = curr_dir.joinpath(constants.CONFIG_FILENAME)
-    tuning_config = open_config_with_defaults(local_config_path)
+    The score is 0 when the template has no evaluation json.
+    """
+    registry_entry = TEMPLATE_REGISTRY.get(template_id)
+    cached_result = RESPONSE_CACHE.get(registry_entry.fingerprint, file_data)
+    if cached_result is not None:
+        logger.info(f"Found cached response for: '{file_name}'")
+        return cached_result
 
-    if template_id is None:
-        template_path = constants.TEMPLATE_FILENAME
-    else:
-        template_path = "templates/" + template_id + ".json"
+    with registry_entry.lock:
+        if registry_entry.closed:
+            # Replaced by a newer entry while waiting for the lock
+            return process_and_get_scored_result(template_id, file_data, file_name)
+        try:
+            result = read_and_get_result(registry_entry, file_data, file_name)
+        finally:
+            # Note: the registry keeps the template and its writer threads alive,
+            # write the marked images and raise their errors before returning
+            registry_entry.template.image_instance_ops.image_writer.flush()
+    if result is not None:
+        RESPONSE_CACHE.put(registry_entry.fingerprint, file_data, *result)
+    return result
 
-    # Update local template (in current recursion stack)
-    local_template_path = curr_dir.joinpath(template_path)
-    template = Template(
-        local_template_path,
-        tuning_config,
-    )
+
+def read_and_get_result(registry_entry, file_data, file_name):
+    in_omr = decode_omr_data(file_data, get_decode_size(registry_entry.tuning_config))
+
+    logger.info("")
+    logger.info(f"Opening image: \t'{file_name}'\tResolution: {in_omr.shape}")
+
+    template = registry_entry.template
+    outputs_namespace = registry_entry.outputs_namespace
 
     template.image_instance_ops.reset_all_save_img()
 
@@ -67,34 +238,22 @@ def process_and_get_result(
         file_name, in_omr, template
     )
 
-    output_dir = Path('output')
-    paths = Paths(output_dir)
-
-    outputs_namespace = setup_outputs_for_template(paths, template)
-
     if in_omr is None:
         # Error OMR case
         new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
-        outputs_namespace.OUTPUT_SET.append(
-            [file_name] + outputs_namespace.empty_resp
-        )
+        outputs_namespace.OUTPUT_SET.append([file_name] + outputs_namespace.empty_resp)
         if check_and_move(
-                constants.ERROR_CODES.NO_MARKER_ERR, file_name, new_file_path
+            constants.ERROR_CODES.NO_MARKER_ERR, file_name, new_file_path
         ):
             err_line = [
-                           file_name,
-                           file_name,
-                           new_file_path,
-                           "NA",
-                       ] + outputs_namespace.empty_resp
-            pd.DataFrame(err_line, dtype=str).T.to_csv(
-                outputs_namespace.files_obj["Errors"],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
-            return
+                file_name,
+                file_name,
+                new_file_path,
+                "NA",
+            ] + outputs_namespace.empty_resp
+            results_writer = outputs_namespace.results_writer
+            results_writer.write_row("Errors", err_line)
+        return None
 
     # uniquify
     file_id = str(file_name)
@@ -112,4 +271,9 @@ def process_and_get_result(
     # concatenate roll nos, set unmarked responses, etc
     omr_response = get_concatenated_response(response_dict, template)
 
-    return omr_response
+    score = 0
+    evaluation_config = registry_entry.evaluation_config
+    if evaluation_config is not None:
+        score = evaluate_concatenated_response(omr_response, evaluation_config)
+
+    return omr_response, score
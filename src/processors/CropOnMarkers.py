@@ -8,6 +8,9 @@ from src.processors.interfaces.ImagePreprocessor import ImagePreprocessor
 from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils
 
+# Smallest marker size (in pixels) to match on a downscaled image
+MIN_PYRAMID_MARKER_SIZE = 8
+
 
 class CropOnMarkers(ImagePreprocessor):
     def __init__(self, *args, **kwargs):
@@ -29,6 +32,36 @@ class CropOnMarkers(ImagePreprocessor):
         self.marker_rescale_steps = int(marker_ops.get("marker_rescale_steps", 10))
         self.apply_erode_subtract = marker_ops.get("apply_erode_subtract", True)
         self.marker = self.load_marker(marker_ops, config)
+        self.rescaled_markers = self.get_rescaled_markers()
+
+        # Sheets of a batch usually match on the same scale, try it first
+        self.use_scale_cache = marker_ops.get("use_scale_cache", False)
+        self.scale_cache_min_confidence = marker_ops.get(
+            "scale_cache_min_confidence", 0.7
+        )
+        self.last_best_scale = None
+        self.scale_cache_hits, self.scale_cache_misses = 0, 0
+
+        # Coarse-to-fine matching: find candidates on a downscaled image, then
+        # refine them within a small window at full resolution
+        self.use_pyramid_matching = marker_ops.get("use_pyramid_matching", False)
+        self.pyramid_levels = int(marker_ops.get("pyramid_levels", 1))
+        self.pyramid_search_margin = int(
+            marker_ops.get("pyramid_search_margin", 4 * 2**self.pyramid_levels)
+        )
+        if self.use_pyramid_matching:
+            self.downscaled_markers = self.get_downscaled_markers()
+
+        # Expected marker regions [x1, y1, x2, y2] per quad as fractions of the
+        # page, either given or learned from the first few sheets
+        self.marker_regions = marker_ops.get("marker_regions", None)
+        self.learn_marker_regions = int(marker_ops.get("learn_marker_regions", 0))
+        self.marker_region_margin = marker_ops.get("marker_region_margin", 0.02)
+        self.marker_region_min_confidence = marker_ops.get(
+            "marker_region_min_confidence", 0.6
+        )
+        self.learned_marker_rects = []
+        self.region_fallbacks = 0
 
     def __str__(self):
         return self.marker_path
@@ -64,16 +97,16 @@ class CropOnMarkers(ImagePreprocessor):
                 InteractionUtils.show("Quads", image_eroded_sub, config=config)
             return None
 
-        optimal_marker = ImageUtils.resize_util_h(
-            self.marker, u_height=int(self.marker.shape[0] * best_scale)
-        )
+        optimal_marker = self.rescaled_markers[best_scale]
         _h, w = optimal_marker.shape[:2]
         centres = []
         sum_t, max_t = 0, 0
         quarter_match_log = "Matching Marker:  "
+        marker_rects = []
         for k in range(0, 4):
-            res = cv2.matchTemplate(quads[k], optimal_marker, cv2.TM_CCOEFF_NORMED)
-            max_t = res.max()
+            max_t, pt, res = self.find_marker_in_quad(
+                k, quads[k], origins[k], image_eroded_sub, best_scale, all_max_t
+            )
             quarter_match_log += f"Quarter{str(k + 1)}: {str(round(max_t, 3))}\t"
             if (
                 max_t < self.min_matching_threshold
@@ -107,10 +140,6 @@ class CropOnMarkers(ImagePreprocessor):
                     )
                 return None
 
-            pt = np.argwhere(res == max_t)[0]
-            pt = [pt[1], pt[0]]
-            pt[0] += origins[k][0]
-            pt[1] += origins[k][1]
             # print(">>",pt)
             image = cv2.rectangle(
                 image, tuple(pt), (pt[0] + w, pt[1] + _h), (150, 150, 150), 2
@@ -124,12 +153,22 @@ class CropOnMarkers(ImagePreprocessor):
                 4,
             )
             centres.append([pt[0] + w / 2, pt[1] + _h / 2])
+            marker_rects.append(
+                [pt[0] / w1, pt[1] / h1, (pt[0] + w) / w1, (pt[1] + _h) / h1]
+            )
             sum_t += max_t
 
         logger.info(quarter_match_log)
         logger.info(f"Optimal Scale: {best_scale}")
+        if self.use_scale_cache:
+            hits, misses, hit_rate = self.get_scale_cache_stats()
+            logger.info(
+                f"Scale cache hits: {hits}/{hits + misses} ({round(hit_rate * 100, 1)}%)"
+            )
         # analysis data
         self.threshold_circles.append(sum_t / 4)
+        if self.marker_regions is None and self.learn_marker_regions > 0:
+            self.learn_marker_rects(marker_rects)
 
         image = ImageUtils.four_point_transform(image, np.array(centres))
         # appendSaveImg(1,image_eroded_sub)
@@ -161,6 +200,66 @@ class CropOnMarkers(ImagePreprocessor):
         # image_eroded_sub = image_norm - cv2.erode(image_norm, kernel=np.ones((5,5)),iterations=2)
         return image
 
+    def find_marker_in_quad(
+        self, k, quad, origin, image_eroded_sub, best_scale, all_max_t
+    ):
+        """Returns (max_t, [x, y], res) of the marker in k-th quad, in page coordinates"""
+        optimal_marker = self.rescaled_markers[best_scale]
+        if self.marker_regions is not None:
+            max_t, pt, res = self.match_marker_in_rect(
+                image_eroded_sub,
+                optimal_marker,
+                self.get_region_rect(k, image_eroded_sub.shape[:2]),
+            )
+            if (
+                max_t >= self.marker_region_min_confidence
+                and abs(all_max_t - max_t) < self.max_matching_variation
+            ):
+                return max_t, pt, res
+            # Fallback to the whole quad
+            self.region_fallbacks += 1
+            logger.warning(
+                f"Low marker match in the expected region of Quad {k + 1}: {round(max_t, 3)}, searching the whole quad"
+            )
+
+        if self.use_pyramid_matching:
+            max_t, pt, res = self.match_marker_pyramid(
+                quad, optimal_marker, self.downscaled_markers[best_scale]
+            )
+        else:
+            res = cv2.matchTemplate(quad, optimal_marker, cv2.TM_CCOEFF_NORMED)
+            max_t = res.max()
+            pt = np.argwhere(res == max_t)[0]
+            pt = [pt[1], pt[0]]
+        pt[0] += origin[0]
+        pt[1] += origin[1]
+        return max_t, pt, res
+
+    def get_region_rect(self, k, image_shape):
+        h, w = image_shape
+        x1, y1, x2, y2 = self.marker_regions[k]
+        return [int(x1 * w), int(y1 * h), int(np.ceil(x2 * w)), int(np.ceil(y2 * h))]
+
+    def learn_marker_rects(self, marker_rects):
+        self.learned_marker_rects.append(marker_rects)
+        if len(self.learned_marker_rects) < self.learn_marker_regions:
+            return
+        learned_marker_rects = np.array(self.learned_marker_rects)
+        margin = self.marker_region_margin
+        self.marker_regions = np.clip(
+            np.hstack(
+                [
+                    learned_marker_rects[:, :, :2].min(axis=0) - margin,
+                    learned_marker_rects[:, :, 2:].max(axis=0) + margin,
+                ]
+            ),
+            0,
+            1,
+        ).tolist()
+        logger.info(
+            f"Learned marker regions: {np.round(self.marker_regions, 3).tolist()}"
+        )
+
     def load_marker(self, marker_ops, config):
         if not os.path.exists(self.marker_path):
             logger.error(
@@ -189,15 +288,12 @@ class CropOnMarkers(ImagePreprocessor):
 
     # Resizing the marker within scaleRange at rate of descent_per_step to
     # find the best match.
-    def getBestMatch(self, image_eroded_sub):
-        config = self.tuning_config
+    def get_rescaled_markers(self):
         descent_per_step = (
             self.marker_rescale_range[1] - self.marker_rescale_range[0]
         ) // self.marker_rescale_steps
         _h, _w = self.marker.shape[:2]
-        res, best_scale = None, None
-        all_max_t = 0
-
+        rescaled_markers = {}
         for r0 in np.arange(
             self.marker_rescale_range[1],
             self.marker_rescale_range[0],
@@ -206,18 +302,179 @@ class CropOnMarkers(ImagePreprocessor):
             s = float(r0 * 1 / 100)
             if s == 0.0:
                 continue
-            rescaled_marker = ImageUtils.resize_util_h(
+            rescaled_markers[s] = ImageUtils.resize_util_h(
                 self.marker, u_height=int(_h * s)
             )
+        return rescaled_markers
+
+    def get_downscaled_markers(self):
+        # Limit the levels so that the smallest marker is still matchable
+        min_marker_size = min(min(m.shape[:2]) for m in self.rescaled_markers.values())
+        while self.pyramid_levels > 0 and (
+            min_marker_size // 2**self.pyramid_levels < MIN_PYRAMID_MARKER_SIZE
+        ):
+            self.pyramid_levels -= 1
+        if self.pyramid_levels == 0:
+            logger.warning(
+                f"Marker too small for pyramid matching, using full resolution for '{self.marker_path}'"
+            )
+        return {
+            s: self.pyr_down(rescaled_marker)
+            for s, rescaled_marker in self.rescaled_markers.items()
+        }
+
+    def pyr_down(self, image):
+        for _ in range(self.pyramid_levels):
+            image = cv2.pyrDown(image)
+        return image
+
+    def match_marker_pyramid(self, image, marker, downscaled_marker):
+        """Returns the full resolution (max_t, [x, y], res) of the marker in the image,
+        searching only around the best match on the downscaled image"""
+        downscaled_image = self.pyr_down(image)
+        if (
+            downscaled_image.shape[0] < downscaled_marker.shape[0]
+            or downscaled_image.shape[1] < downscaled_marker.shape[1]
+        ):
+            return self.match_marker_in_window(image, marker, [0, 0], image.shape[:2])
+        res = cv2.matchTemplate(
+            downscaled_image, downscaled_marker, cv2.TM_CCOEFF_NORMED
+        )
+        y, x = np.unravel_index(np.argmax(res), res.shape)
+        factor = 2**self.pyramid_levels
+        return self.match_marker_in_window(
+            image, marker, [x * factor, y * factor], [self.pyramid_search_margin] * 2
+        )
+
+    @staticmethod
+    def match_marker_in_window(image, marker, pt, margins):
+        _h, _w = marker.shape[:2]
+        return CropOnMarkers.match_marker_in_rect(
+            image,
+            marker,
+            [
+                pt[0] - margins[1],
+                pt[1] - margins[0],
+                pt[0] + _w + margins[1],
+                pt[1] + _h + margins[0],
+            ],
+        )
+
+    @staticmethod
+    def match_marker_in_rect(image, marker, rect):
+        """Returns (max_t, [x, y], res) of the marker within rect = [x1, y1, x2, y2]"""
+        h, w = image.shape[:2]
+        _h, _w = marker.shape[:2]
+        x1, y1, x2, y2 = rect
+        # Grow the rect to fit the marker
+        x1, y1 = min(x1, x2 - _w), min(y1, y2 - _h)
+        x1, y1 = max(0, min(x1, w - _w)), max(0, min(y1, h - _h))
+        x2, y2 = min(w, max(x2, x1 + _w)), min(h, max(y2, y1 + _h))
+        res = cv2.matchTemplate(image[y1:y2, x1:x2], marker, cv2.TM_CCOEFF_NORMED)
+        max_t = res.max()
+        match_pt = np.argwhere(res == max_t)[0]
+        return max_t, [match_pt[1] + x1, match_pt[0] + y1], res
+
+    def get_cached_scales(self):
+        # The last best scale along with its neighbours (in the same reverse order)
+        all_scales = list(self.rescaled_markers.keys())
+        scale_index = all_scales.index(self.last_best_scale)
+        return all_scales[max(0, scale_index - 1) : scale_index + 2]
+
+    def match_marker_scales(self, image_eroded_sub, scales):
+        if self.marker_regions is not None:
+            (
+                best_scale,
+                all_max_t,
+                res,
+                min_region_t,
+            ) = self.match_marker_scales_in_regions(image_eroded_sub, scales)
+            # Every region should hold a marker at the best scale
+            if min_region_t >= self.marker_region_min_confidence:
+                return best_scale, all_max_t, res
+            # Fallback to the whole image
+            self.region_fallbacks += 1
+            logger.warning(
+                f"Low marker match in the expected regions: {round(min_region_t, 3)}, searching the whole image"
+            )
+        if self.use_pyramid_matching:
+            return self.match_marker_scales_pyramid(image_eroded_sub, scales)
+        res, best_scale = None, None
+        all_max_t = 0
+        for s in scales:
             # res is the black image with white dots
             res = cv2.matchTemplate(
-                image_eroded_sub, rescaled_marker, cv2.TM_CCOEFF_NORMED
+                image_eroded_sub, self.rescaled_markers[s], cv2.TM_CCOEFF_NORMED
             )
 
             max_t = res.max()
             if all_max_t < max_t:
                 # print('Scale: '+str(s)+', Circle Match: '+str(round(max_t*100,2))+'%')
                 best_scale, all_max_t = s, max_t
+        return best_scale, all_max_t, res
+
+    def match_marker_scales_in_regions(self, image_eroded_sub, scales):
+        """Returns (best_scale, all_max_t, res, min_region_t) over the marker regions"""
+        region_rects = [
+            self.get_region_rect(k, image_eroded_sub.shape[:2]) for k in range(0, 4)
+        ]
+        res, best_scale = None, None
+        all_max_t, min_region_t = 0, 0
+        for s in scales:
+            region_matches = [
+                self.match_marker_in_rect(
+                    image_eroded_sub, self.rescaled_markers[s], region_rect
+                )
+                for region_rect in region_rects
+            ]
+            for max_t, _pt, region_res in region_matches:
+                if all_max_t < max_t:
+                    best_scale, all_max_t, res = s, max_t, region_res
+                    min_region_t = min(t for t, _, _ in region_matches)
+        return best_scale, all_max_t, res, min_region_t
+
+    def match_marker_scales_pyramid(self, image_eroded_sub, scales):
+        downscaled_image = self.pyr_down(image_eroded_sub)
+        best_scale, best_pt = None, None
+        coarse_max_t = 0
+        for s in scales:
+            res = cv2.matchTemplate(
+                downscaled_image, self.downscaled_markers[s], cv2.TM_CCOEFF_NORMED
+            )
+            max_t = res.max()
+            if coarse_max_t < max_t:
+                y, x = np.unravel_index(np.argmax(res), res.shape)
+                best_scale, best_pt, coarse_max_t = s, [x, y], max_t
+
+        if best_scale is None:
+            return None, 0, None
+
+        factor = 2**self.pyramid_levels
+        all_max_t, _pt, res = self.match_marker_in_window(
+            image_eroded_sub,
+            self.rescaled_markers[best_scale],
+            [best_pt[0] * factor, best_pt[1] * factor],
+            [self.pyramid_search_margin] * 2,
+        )
+        return best_scale, all_max_t, res
+
+    def getBestMatch(self, image_eroded_sub):
+        config = self.tuning_config
+
+        if self.use_scale_cache and self.last_best_scale is not None:
+            best_scale, all_max_t, _res = self.match_marker_scales(
+                image_eroded_sub, self.get_cached_scales()
+            )
+            if all_max_t >= self.scale_cache_min_confidence:
+                self.scale_cache_hits += 1
+                self.last_best_scale = best_scale
+                return best_scale, all_max_t
+            # Fallback to the full sweep
+            self.scale_cache_misses += 1
+
+        best_scale, all_max_t, res = self.match_marker_scales(
+            image_eroded_sub, self.rescaled_markers.keys()
+        )
 
         if all_max_t < self.min_matching_threshold:
             logger.warning(
@@ -230,4 +487,11 @@ class CropOnMarkers(ImagePreprocessor):
             logger.warning(
                 "No matchings for given scaleRange:", self.marker_rescale_range
             )
+        elif self.use_scale_cache:
+            self.last_best_scale = best_scale
         return best_scale, all_max_t
+
+    def get_scale_cache_stats(self):
+        total = self.scale_cache_hits + self.scale_cache_misses
+        hit_rate = self.scale_cache_hits / total if total > 0 else 0
+        return self.scale_cache_hits, self.scale_cache_misses, hit_rate
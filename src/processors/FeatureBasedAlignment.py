@@ -9,6 +9,16 @@ from src.processors.interfaces.ImagePreprocessor import ImagePreprocessor
 from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils
 
+# Parameters of the FLANN based LSH index for binary (ORB) descriptors
+FLANN_INDEX_LSH = 6
+FLANN_LSH_INDEX_PARAMS = {
+    "algorithm": FLANN_INDEX_LSH,
+    "table_number": 6,
+    "key_size": 12,
+    "multi_probe_level": 1,
+}
+FLANN_SEARCH_PARAMS = {"checks": 50}
+
 
 class FeatureBasedAlignment(ImagePreprocessor):
     def __init__(self, *args, **kwargs):
@@ -28,11 +38,18 @@ class FeatureBasedAlignment(ImagePreprocessor):
         self.max_features = int(options.get("maxFeatures", 500))
         self.good_match_percent = options.get("goodMatchPercent", 0.15)
         self.transform_2_d = options.get("2d", False)
+        self.use_flann_matcher = options.get("useFlannMatcher", False)
+        # Detect features on a downscaled copy, warp at full resolution
+        self.detection_scale = options.get("detectionScale", 1.0)
+        self.detection_ref_img = self.get_detection_image(self.ref_img)
         # Extract keypoints and description of source image
         self.orb = cv2.ORB_create(self.max_features)
         self.to_keypoints, self.to_descriptors = self.orb.detectAndCompute(
-            self.ref_img, None
+            self.detection_ref_img, None
         )
+        self.to_points = cv2.KeyPoint_convert(self.to_keypoints)
+        # Train the matcher on the reference descriptors once for all images
+        self.matcher = self.get_trained_matcher()
 
     def __str__(self):
         return self.ref_path.name
@@ -40,6 +57,40 @@ class FeatureBasedAlignment(ImagePreprocessor):
     def exclude_files(self):
         return [self.ref_path]
 
+    def get_trained_matcher(self):
+        if self.use_flann_matcher:
+            # Approximate matching, faster for large number of features
+            matcher = cv2.FlannBasedMatcher(FLANN_LSH_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+        else:
+            matcher = cv2.DescriptorMatcher_create(
+                cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_HAMMING
+            )
+        matcher.add([self.to_descriptors])
+        matcher.train()
+        return matcher
+
+    def get_detection_image(self, image):
+        if self.detection_scale == 1.0:
+            return image
+        return cv2.resize(
+            image,
+            None,
+            fx=self.detection_scale,
+            fy=self.detection_scale,
+            interpolation=cv2.INTER_AREA,
+        )
+
+    def get_full_scale_transform(self, transform):
+        # Rescale the affine(2x3) or homography(3x3) found on the detection scale
+        if self.detection_scale == 1.0:
+            return transform
+        rows = transform.shape[0]
+        full_transform = np.eye(3)
+        full_transform[:rows] = transform
+        scale_up = np.diag([1 / self.detection_scale, 1 / self.detection_scale, 1])
+        scale_down = np.diag([self.detection_scale, self.detection_scale, 1])
+        return (scale_up @ full_transform @ scale_down)[:rows]
+
     def apply_filter(self, image, _file_path):
         config = self.tuning_config
         # Convert images to grayscale
@@ -49,46 +100,48 @@ class FeatureBasedAlignment(ImagePreprocessor):
         image = cv2.normalize(image, 0, 255, norm_type=cv2.NORM_MINMAX)
 
         # Detect ORB features and compute descriptors.
-        from_keypoints, from_descriptors = self.orb.detectAndCompute(image, None)
-
-        # Match features.
-        matcher = cv2.DescriptorMatcher_create(
-            cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_HAMMING
+        detection_image = self.get_detection_image(image)
+        from_keypoints, from_descriptors = self.orb.detectAndCompute(
+            detection_image, None
         )
 
-        # create BFMatcher object (alternate matcher)
-        # matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-
-        matches = np.array(matcher.match(from_descriptors, self.to_descriptors, None))
+        # Match features against the trained reference descriptors
+        matches = self.matcher.match(from_descriptors)
 
         # Sort matches by score
-        matches = sorted(matches, key=lambda x: x.distance, reverse=False)
+        distances = np.array([match.distance for match in matches])
+        sorted_indices = np.argsort(distances, kind="stable")
 
         # Remove not so good matches
         num_good_matches = int(len(matches) * self.good_match_percent)
-        matches = matches[:num_good_matches]
+        good_indices = sorted_indices[:num_good_matches]
 
         # Draw top matches
         if config.outputs.show_image_level > 2:
             im_matches = cv2.drawMatches(
-                image, from_keypoints, self.ref_img, self.to_keypoints, matches, None
+                detection_image,
+                from_keypoints,
+                self.detection_ref_img,
+                self.to_keypoints,
+                [matches[i] for i in good_indices],
+                None,
             )
             InteractionUtils.show("Aligning", im_matches, resize=True, config=config)
 
         # Extract location of good matches
-        points1 = np.zeros((len(matches), 2), dtype=np.float32)
-        points2 = np.zeros((len(matches), 2), dtype=np.float32)
-
-        for i, match in enumerate(matches):
-            points1[i, :] = from_keypoints[match.queryIdx].pt
-            points2[i, :] = self.to_keypoints[match.trainIdx].pt
+        query_indices = np.array([match.queryIdx for match in matches], dtype=int)
+        train_indices = np.array([match.trainIdx for match in matches], dtype=int)
+        points1 = cv2.KeyPoint_convert(from_keypoints)[query_indices[good_indices]]
+        points2 = self.to_points[train_indices[good_indices]]
 
         # Find homography
         height, width = self.ref_img.shape
         if self.transform_2_d:
             m, _inliers = cv2.estimateAffine2D(points1, points2)
+            m = self.get_full_scale_transform(m)
             return cv2.warpAffine(image, m, (width, height))
 
         # Use homography
         h, _mask = cv2.findHomography(points1, points2, cv2.RANSAC)
+        h = self.get_full_scale_transform(h)
         return cv2.warpPerspective(image, h, (width, height))
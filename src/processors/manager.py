@@ -30,11 +30,17 @@ class ProcessorManager:
     """
 
     def __init__(self, processors_dir="src.processors"):
-        """Constructor that initiates the reading of all available processors
-        when an instance of the ProcessorCollection object is created
+        """Constructor of the processors collection. The available processors
+        are read on the first lookup, so that importing the manager stays cheap
         """
         self.processors_dir = processors_dir
-        self.reload_processors()
+        self.loaded_processors = None
+
+    @property
+    def processors(self):
+        if self.loaded_processors is None:
+            self.reload_processors()
+        return self.loaded_processors
 
     @staticmethod
     def get_name_filter(processor_name):
@@ -47,7 +53,7 @@ class ProcessorManager:
         """Reset the list of all processors and initiate the walk over the main
         provided processor package to load all available processors
         """
-        self.processors = {}
+        self.loaded_processors = {}
         self.seen_paths = []
 
         logger.info(f'Loading processors from "{self.processors_dir}"...')
@@ -70,7 +76,7 @@ class ProcessorManager:
                 for _, c in clsmembers:
                     # Only add classes that are a sub class of Processor, but NOT Processor itself
                     if issubclass(c, Processor) & (c is not Processor):
-                        self.processors[c.__name__] = c
+                        self.loaded_processors[c.__name__] = c
                         loaded_packages.append(c.__name__)
 
         logger.info(f"Loaded processors: {loaded_packages}")
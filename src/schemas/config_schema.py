@@ -14,6 +14,7 @@ CONFIG_SCHEMA = {
                 "display_width": {"type": "integer"},
                 "processing_height": {"type": "integer"},
                 "processing_width": {"type": "integer"},
+                "reduced_decode": {"type": "boolean"},
             },
         },
         "threshold_params": {
@@ -51,6 +52,12 @@ CONFIG_SCHEMA = {
                 "save_detections": {"type": "boolean"},
                 # This option moves multimarked files into a separate folder for manual checking, skipping evaluation
                 "filter_out_multimarked_files": {"type": "boolean"},
+                "headless": {"type": "boolean"},
+                "image_writer_threads": {"type": "integer", "minimum": 0},
+                "jpeg_quality": {"type": "integer", "minimum": 0, "maximum": 100},
+                "png_compression": {"type": "integer", "minimum": 0, "maximum": 9},
+                "results_batch_size": {"type": "integer", "minimum": 1},
+                "results_format": {"enum": ["csv", "parquet"], "type": "string"},
             },
         },
     },
@@ -90,12 +90,42 @@ TEMPLATE_SCHEMA = {
                                     "additionalProperties": False,
                                     "properties": {
                                         "apply_erode_subtract": {"type": "boolean"},
+                                        "learn_marker_regions": {
+                                            "type": "integer",
+                                            "minimum": 0,
+                                        },
+                                        "marker_region_margin": zero_to_one_number,
+                                        "marker_region_min_confidence": zero_to_one_number,
+                                        "marker_regions": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "array",
+                                                "items": zero_to_one_number,
+                                                "minItems": 4,
+                                                "maxItems": 4,
+                                            },
+                                            "minItems": 4,
+                                            "maxItems": 4,
+                                        },
                                         "marker_rescale_range": two_positive_numbers,
                                         "marker_rescale_steps": {"type": "number"},
                                         "max_matching_variation": {"type": "number"},
                                         "min_matching_threshold": {"type": "number"},
+                                        "pyramid_levels": {
+                                            "type": "integer",
+                                            "minimum": 1,
+                                        },
+                                        "pyramid_search_margin": {
+                                            "type": "integer",
+                                            "minimum": 0,
+                                        },
                                         "relativePath": {"type": "string"},
+                                        "scale_cache_min_confidence": {
+                                            "type": "number"
+                                        },
                                         "sheetToMarkerWidthRatio": {"type": "number"},
+                                        "use_pyramid_matching": {"type": "boolean"},
+                                        "use_scale_cache": {"type": "boolean"},
                                     },
                                     "required": ["relativePath"],
                                 }
@@ -113,9 +143,15 @@ TEMPLATE_SCHEMA = {
                                     "additionalProperties": False,
                                     "properties": {
                                         "2d": {"type": "boolean"},
+                                        "detectionScale": {
+                                            "type": "number",
+                                            "exclusiveMinimum": 0,
+                                            "maximum": 1,
+                                        },
                                         "goodMatchPercent": {"type": "number"},
                                         "maxFeatures": {"type": "integer"},
                                         "reference": {"type": "string"},
+                                        "useFlannMatcher": {"type": "boolean"},
                                     },
                                     "required": ["reference"],
                                 }
@@ -6,6 +6,10 @@
  Github: https://github.com/Udayraj123
 
 """
+from functools import cached_property
+
+import numpy as np
+
 from src.constants import FIELD_TYPES
 from src.core import ImageInstanceOps
 from src.logger import logger
@@ -49,6 +53,7 @@ class Template:
         self.parse_output_columns(output_columns_array)
         self.setup_pre_processors(pre_processors_object, template_path.parent)
         self.setup_field_blocks(field_blocks_object)
+        self.compiled_layout = CompiledLayout(self.field_blocks)
         self.parse_custom_labels(custom_labels_object)
 
         non_custom_columns, all_custom_columns = (
@@ -292,19 +297,92 @@ class FieldBlock:
         labels_gap,
     ):
         _h, _v = (1, 0) if (direction == "vertical") else (0, 1)
-        self.traverse_bubbles = []
-        # Generate the bubble grid
-        lead_point = [float(self.origin[0]), float(self.origin[1])]
-        for field_label in self.parsed_field_labels:
-            bubble_point = lead_point.copy()
-            field_bubbles = []
-            for bubble_value in bubble_values:
-                field_bubbles.append(
-                    Bubble(bubble_point.copy(), field_label, field_type, bubble_value)
-                )
-                bubble_point[_h] += bubbles_gap
-            self.traverse_bubbles.append(field_bubbles)
-            lead_point[_v] += labels_gap
+        self.bubble_values = bubble_values
+        self.field_type = field_type
+        # Note: accumulate the gaps one by one (instead of multiplying) to round
+        # the same float positions as the earlier point by point traversal
+        lead_points = np.add.accumulate(
+            [float(self.origin[_v])]
+            + [labels_gap] * (len(self.parsed_field_labels) - 1)
+        )
+        bubble_points = np.add.accumulate(
+            [float(self.origin[_h])] + [bubbles_gap] * (len(bubble_values) - 1)
+        )
+        # Generate the bubble grid: [field][bubble] => [x, y]
+        self.bubble_coords = np.empty(
+            (len(self.parsed_field_labels), len(bubble_values), 2), dtype=np.int32
+        )
+        self.bubble_coords[:, :, _v] = np.round(lead_points)[:, np.newaxis]
+        self.bubble_coords[:, :, _h] = np.round(bubble_points)[np.newaxis, :]
+
+    @cached_property
+    def traverse_bubbles(self):
+        return [
+            [
+                Bubble(pt, field_label, self.field_type, bubble_value)
+                for pt, bubble_value in zip(field_coords.tolist(), self.bubble_values)
+            ]
+            for field_label, field_coords in zip(
+                self.parsed_field_labels, self.bubble_coords
+            )
+        ]
+
+
+class CompiledLayout:
+    """
+    Contiguous arrays for all the bubbles of a template, in traversal order.
+
+    The bubbles of i-th field strip are at strip_offsets[i]:strip_offsets[i + 1],
+    and value_codes index into bubble_values.
+    """
+
+    def __init__(self, field_blocks):
+        self.field_labels, self.empty_values, self.bubble_values = [], [], []
+        value_code_map = {}
+        coords, block_indices, value_codes, strip_lengths = [], [], [], []
+        for block_index, field_block in enumerate(field_blocks):
+            fields_count, values_count = field_block.bubble_coords.shape[:2]
+            block_value_codes = [
+                value_code_map.setdefault(bubble_value, len(value_code_map))
+                for bubble_value in field_block.bubble_values
+            ]
+            coords.append(field_block.bubble_coords.reshape(-1, 2))
+            block_indices.append(np.full(fields_count * values_count, block_index))
+            value_codes.append(np.tile(block_value_codes, fields_count))
+            strip_lengths.extend([values_count] * fields_count)
+            self.field_labels.extend(field_block.parsed_field_labels)
+            self.empty_values.extend([field_block.empty_val] * fields_count)
+
+        self.bubble_values = list(value_code_map.keys())
+        self.coords = np.concatenate(coords or [np.empty((0, 2))]).astype(np.int32)
+        self.block_indices = np.concatenate(block_indices or [[]]).astype(np.int32)
+        self.value_codes = np.concatenate(value_codes or [[]]).astype(np.int32)
+        self.strip_offsets = np.concatenate([[0], np.cumsum(strip_lengths)]).astype(
+            np.int32
+        )
+        self.field_indices = np.repeat(
+            np.arange(len(strip_lengths), dtype=np.int32), strip_lengths
+        )
+        self.block_dimensions = np.array(
+            [field_block.bubble_dimensions for field_block in field_blocks],
+            dtype=np.int32,
+        ).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def get_strip_matrix(self, bubble_vals):
+        """Returns the bubble values as a (strips x bubbles) matrix padded with NaN"""
+        strip_offsets = self.strip_offsets
+        strip_lengths = np.diff(strip_offsets)
+        strip_matrix = np.full(
+            (len(strip_lengths), strip_lengths.max(initial=0)), np.nan
+        )
+        positions = (
+            np.arange(len(self.field_indices)) - strip_offsets[self.field_indices]
+        )
+        strip_matrix[self.field_indices, positions] = bubble_vals
+        return strip_matrix
 
 
 class Bubble:
@@ -1,7 +1,11 @@
+import json
 import os
 import shutil
+import zipfile
 from glob import glob
 
+import pytest
+
 from src.tests.utils import run_entry_point, setup_mocker_patches
 
 
@@ -10,7 +14,7 @@ def read_file(path):
         return file.read()
 
 
-def run_sample(mocker, sample_path):
+def run_sample(mocker, sample_path, **extra_args):
     setup_mocker_patches(mocker)
 
     input_path = os.path.join("samples", sample_path)
@@ -20,7 +24,7 @@ def run_sample(mocker, sample_path):
             f"Warning: output directory already exists: {output_dir}. This may affect the test execution."
         )
 
-    run_entry_point(input_path, output_dir)
+    run_entry_point(input_path, output_dir, **extra_args)
 
     sample_outputs = extract_sample_outputs(output_dir)
 
@@ -110,3 +114,161 @@ def test_run_community_UmarFarootAPS(mocker, snapshot):
 def test_run_community_UPSC_mock(mocker, snapshot):
     sample_outputs = run_sample(mocker, "community/UPSC-mock")
     assert snapshot == sample_outputs
+
+
+def test_run_community_UmarFarootAPS_with_workers(mocker):
+    serial_outputs = run_sample(mocker, "community/UmarFarootAPS")
+    sample_outputs = run_sample(mocker, "community/UmarFarootAPS", workers=2)
+    assert sample_outputs == serial_outputs
+
+
+def test_run_community_UmarFarootAPS_with_prefetch(mocker):
+    serial_outputs = run_sample(mocker, "community/UmarFarootAPS")
+    sample_outputs = run_sample(mocker, "community/UmarFarootAPS", prefetch=2)
+    assert sample_outputs == serial_outputs
+
+
+def test_run_community_UmarFarootAPS_resumed(mocker):
+    serial_outputs = run_sample(mocker, "community/UmarFarootAPS")
+
+    setup_mocker_patches(mocker)
+    input_path = os.path.join("samples", "community", "UmarFarootAPS")
+    output_dir = os.path.join("outputs", "community", "UmarFarootAPS")
+    run_entry_point(input_path, output_dir, resume=True)
+    # All files are skipped on the second run
+    run_entry_point(input_path, output_dir, resume=True)
+    sample_outputs = extract_sample_outputs(output_dir)
+    shutil.rmtree(output_dir)
+
+    assert sample_outputs == serial_outputs
+
+
+def test_run_community_UmarFarootAPS_resumed_after_plain_run(mocker):
+    setup_mocker_patches(mocker)
+    input_path = os.path.join("samples", "community", "UmarFarootAPS")
+    output_dir = os.path.join("outputs", "community", "UmarFarootAPS")
+    run_entry_point(input_path, output_dir, resume=True)
+    resumed_outputs = extract_sample_outputs(output_dir)
+    run_entry_point(input_path, output_dir)
+    appended_outputs = extract_sample_outputs(output_dir)
+    # The rows appended by the plain run are kept, as it removed the manifest
+    run_entry_point(input_path, output_dir, resume=True)
+    sample_outputs = extract_sample_outputs(output_dir)
+    shutil.rmtree(output_dir)
+
+    assert appended_outputs != resumed_outputs
+    for path, content in appended_outputs.items():
+        assert sample_outputs[path].startswith(content)
+
+
+def test_run_community_UmarFarootAPS_streamed(mocker):
+    serial_outputs = run_sample(mocker, "community/UmarFarootAPS")
+
+    setup_mocker_patches(mocker)
+    input_path = os.path.join("samples", "community", "UmarFarootAPS")
+    output_dir = os.path.join("outputs", "community", "UmarFarootAPS")
+    run_entry_point(input_path, output_dir, stream_files=2, resume=True)
+    # All files are skipped on the second run
+    run_entry_point(input_path, output_dir, stream_files=2, resume=True)
+    sample_outputs = extract_sample_outputs(output_dir)
+    shutil.rmtree(output_dir)
+
+    # Note: the streamed files are processed in the listing order
+    def get_sorted_rows(outputs):
+        return {path: sorted(content.splitlines()) for path, content in outputs.items()}
+
+    assert get_sorted_rows(sample_outputs) == get_sorted_rows(serial_outputs)
+
+
+def test_run_sample1_from_archives(mocker, tmp_path):
+    sample_outputs = run_sample(mocker, "sample1")
+
+    setup_mocker_patches(mocker)
+    output_dir = os.path.join("outputs", "sample1")
+    for archive_format, extra_args in [("zip", {}), ("gztar", {"prefetch": 2})]:
+        archive_path = shutil.make_archive(
+            tmp_path.joinpath("sample1"),
+            archive_format,
+            os.path.join("samples", "sample1"),
+        )
+        run_entry_point(archive_path, output_dir, **extra_args)
+        archive_outputs = extract_sample_outputs(output_dir)
+        shutil.rmtree(output_dir)
+
+        # Note: the input paths point into the archive
+        assert {
+            path: content.replace(archive_path, os.path.join("samples", "sample1"))
+            for path, content in archive_outputs.items()
+        } == sample_outputs
+
+
+def test_run_sample1_from_zip_with_unreadable_members(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    archive_path = shutil.make_archive(
+        tmp_path.joinpath("sample1"), "zip", os.path.join("samples", "sample1")
+    )
+    with zipfile.ZipFile(archive_path, "a") as archive:
+        # Resource fork added by the macOS archiver
+        archive.writestr("__MACOSX/MobileCamera/._sheet1.jpg", b"\x00\x05\x16\x07")
+        archive.writestr("MobileCamera/._sheet2.jpg", b"\x00\x05\x16\x07")
+        archive.writestr("MobileCamera/broken.jpg", b"not an image")
+    output_dir = tmp_path.joinpath("outputs")
+
+    run_entry_point(archive_path, str(output_dir), headless=True)
+
+    results_rows = read_file(next(output_dir.rglob("Results_*.csv"))).splitlines()
+    error_rows = read_file(
+        output_dir.joinpath("MobileCamera", "Manual", "ErrorFiles.csv")
+    ).splitlines()
+    assert [row.split(",")[0] for row in results_rows[1:]] == ['"sheet1.jpg"']
+    assert [row.split(",")[0] for row in error_rows[1:]] == ['"broken.jpg"']
+
+
+def test_run_sample1_set_layout_closes_results_files(mocker, tmp_path):
+    pytest.importorskip("pyarrow")
+    setup_mocker_patches(mocker)
+    output_dir = tmp_path.joinpath("outputs")
+
+    run_entry_point(
+        os.path.join("samples", "sample1"),
+        str(output_dir),
+        setLayout=True,
+        results_format="parquet",
+    )
+
+    assert list(output_dir.rglob("*.partial")) == []
+    assert len(list(output_dir.rglob("Results_*.parquet"))) == 1
+
+
+def test_run_sample1_with_timings_file(mocker, tmp_path):
+    timings_file = tmp_path.joinpath("timings.json")
+    run_sample(mocker, "sample1", timings_file=timings_file)
+
+    with open(timings_file) as f:
+        sheet_timings = json.load(f)
+    assert [sheet["file_id"] for sheet in sheet_timings] == ["sheet1.jpg"]
+    assert set(sheet_timings[0]["timings"]) >= {
+        "decode",
+        "resize",
+        "CropOnMarkers",
+        "bubble_extraction",
+        "thresholding",
+        "drawing",
+        "saving",
+    }
+
+
+def test_run_sample4_headless(mocker, tmp_path):
+    sample_outputs = run_sample(mocker, "sample4")
+    timings_file = tmp_path.joinpath("timings.json")
+    mock_save_img = mocker.patch("src.utils.image.ImageUtils.save_img")
+
+    headless_outputs = run_sample(
+        mocker, "sample4", headless=True, timings_file=timings_file
+    )
+
+    assert headless_outputs == sample_outputs
+    mock_save_img.assert_not_called()
+    with open(timings_file) as f:
+        sheet_timings = json.load(f)
+    assert all("drawing" not in sheet["timings"] for sheet in sheet_timings)
@@ -0,0 +1,66 @@
+from glob import glob
+
+import pandas as pd
+
+from benchmarks.generate_sheets import generate_sheets
+from benchmarks.run_benchmarks import compare_with_baseline, setup_synthetic_batch
+from src.tests.utils import run_entry_point, setup_mocker_patches
+
+
+def read_responses(file_path):
+    return pd.read_csv(file_path, dtype=str, na_filter=False).set_index("file_id")
+
+
+def get_result(throughput, latency_p50, stage_p50):
+    return {
+        "throughput": throughput,
+        "latency": {"p50": latency_p50},
+        "stages": {"saving": {"p50": stage_p50}},
+    }
+
+
+def test_compare_with_baseline_flags_regressions():
+    baseline = {"sample1": get_result(10, 100, 5)}
+
+    _rows, regressions = compare_with_baseline(
+        {"sample1": get_result(9, 110, 5.5)}, baseline, tolerance=0.2
+    )
+    assert regressions == []
+
+    _rows, regressions = compare_with_baseline(
+        {"sample1": get_result(5, 200, 5.9), "sample2": get_result(1, 1, 1)},
+        baseline,
+        tolerance=0.2,
+    )
+    # Note: the stage slowdown is below the noise threshold
+    assert regressions == [
+        "sample1: throughput (sheets/s)",
+        "sample1: latency p50 (ms)",
+    ]
+
+
+def test_setup_synthetic_batch(tmp_path):
+    batch_dir = setup_synthetic_batch("sample1", 5, tmp_path.joinpath("synthetic"))
+    sheet_paths = list(batch_dir.joinpath("MobileCamera").iterdir())
+    assert len(sheet_paths) == 5
+    # The template assets are not replicated
+    assert [path.name for path in batch_dir.glob("*.jpg")] == ["omr_marker.jpg"]
+
+
+def test_generated_sheets_match_ground_truth(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    sheets_dir, ground_truth_path = generate_sheets(
+        "samples/sample1/template.json",
+        3,
+        tmp_path.joinpath("synthetic"),
+        markers=True,
+        rotation=2.0,
+        scale_jitter=0.03,
+    )
+    output_dir = tmp_path.joinpath("outputs")
+    run_entry_point(str(sheets_dir.parent), str(output_dir))
+
+    ground_truth = read_responses(ground_truth_path)
+    (results_path,) = glob(str(output_dir.joinpath("sheets", "Results", "*.csv")))
+    results = read_responses(results_path)
+    assert results[ground_truth.columns].equals(ground_truth)
@@ -0,0 +1,214 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.defaults import CONFIG_DEFAULTS
+from src.template import Template
+from src.utils.file import load_json
+from src.utils.image import AsyncImageWriter, ImageUtils, StageImageRecorder
+from src.utils.parsing import parse_fields
+
+SAMPLE_TEMPLATE_PATH = Path("samples", "sample2", "template.json")
+SAMPLE_IMAGE_PATH = Path("samples", "sample2", "AdrianSample", "adrian_omr.png")
+FRACTIONAL_GAPS_TEMPLATE_PATH = Path(
+    "samples", "community", "Sandeep-1507", "template.json"
+)
+
+
+def read_sample_image(template):
+    image = cv2.imread(str(SAMPLE_IMAGE_PATH), cv2.IMREAD_GRAYSCALE)
+    return cv2.resize(image, tuple(template.page_dimensions))
+
+
+def test_bubble_means_match_per_bubble_mean():
+    template = Template(SAMPLE_TEMPLATE_PATH, CONFIG_DEFAULTS)
+    image = read_sample_image(template)
+    for block_no, field_block in enumerate(template.field_blocks):
+        field_block.shift = (-1) ** block_no * 7
+
+    bubble_means = template.image_instance_ops.get_bubble_means(image, template)
+
+    expected_means = []
+    for field_block in template.field_blocks:
+        box_w, box_h = field_block.bubble_dimensions
+        for field_block_bubbles in field_block.traverse_bubbles:
+            for pt in field_block_bubbles:
+                x, y = (pt.x + field_block.shift, pt.y)
+                expected_means.append(cv2.mean(image[y : y + box_h, x : x + box_w])[0])
+
+    assert bubble_means.tolist() == expected_means
+
+
+def get_expected_bubbles(template_path):
+    """Returns the [x, y] and value of each bubble, by stepping through the gaps"""
+    template = Template(template_path, CONFIG_DEFAULTS)
+    expected_coords, expected_values = [], []
+    field_blocks_object = load_json(template_path)["fieldBlocks"]
+    for block_name, field_block_object in field_blocks_object.items():
+        field_block_object = template.pre_fill_field_block(field_block_object)
+        _h, _v = (1, 0) if (field_block_object["direction"] == "vertical") else (0, 1)
+        lead_point = [float(coord) for coord in field_block_object["origin"]]
+        for _field_label in parse_fields(block_name, field_block_object["fieldLabels"]):
+            bubble_point = lead_point.copy()
+            for bubble_value in field_block_object["bubbleValues"]:
+                expected_coords.append([round(bubble_point[0]), round(bubble_point[1])])
+                expected_values.append(bubble_value)
+                bubble_point[_h] += field_block_object["bubblesGap"]
+            lead_point[_v] += field_block_object["labelsGap"]
+    return template, expected_coords, expected_values
+
+
+def test_compiled_layout_matches_bubble_traversal():
+    # Note: the gaps of the second template are fractional
+    for template_path in [SAMPLE_TEMPLATE_PATH, FRACTIONAL_GAPS_TEMPLATE_PATH]:
+        template, expected_coords, expected_values = get_expected_bubbles(template_path)
+        compiled_layout = template.compiled_layout
+        assert compiled_layout.coords.dtype == np.int32
+        assert compiled_layout.coords.tolist() == expected_coords
+        assert [
+            [bubble.x, bubble.y]
+            for field_block in template.field_blocks
+            for field_block_bubbles in field_block.traverse_bubbles
+            for bubble in field_block_bubbles
+        ] == expected_coords
+
+    template, expected_coords, expected_values = get_expected_bubbles(
+        SAMPLE_TEMPLATE_PATH
+    )
+    compiled_layout = template.compiled_layout
+    # The first two bubbles of q1 and the first bubble of q2
+    assert expected_coords[:2] == [[65, 60], [106, 60]]
+    assert expected_coords[5] == [65, 112]
+    assert [
+        compiled_layout.bubble_values[value_code]
+        for value_code in compiled_layout.value_codes
+    ] == expected_values
+
+    # Mark the first bubble of the first strip and two bubbles of the second strip
+    marked_bubbles = np.zeros(len(compiled_layout), dtype=bool)
+    first_strip, second_strip = compiled_layout.strip_offsets[:2]
+    marked_bubbles[[first_strip, second_strip, second_strip + 1]] = True
+    omr_response, multi_marked = template.image_instance_ops.get_marked_response(
+        compiled_layout, marked_bubbles
+    )
+    first_label, second_label, third_label = compiled_layout.field_labels[:3]
+    assert omr_response[first_label] == expected_values[first_strip]
+    assert omr_response[second_label] == "".join(
+        expected_values[second_strip : second_strip + 2]
+    )
+    assert omr_response[third_label] == compiled_layout.empty_values[2]
+    assert multi_marked
+
+
+def test_local_thresholds_match_scalar_implementation():
+    template = Template(SAMPLE_TEMPLATE_PATH, CONFIG_DEFAULTS)
+    image_instance_ops = template.image_instance_ops
+    rng = np.random.default_rng(0)
+    for global_thr in [100.5, 180, 255]:
+        strips = []
+        for _ in range(400):
+            strip_length = rng.integers(1, 12)
+            # Mix of empty, marked and noisy strips
+            strip = rng.normal(rng.choice([90, 200]), rng.choice([2, 20]), strip_length)
+            strip[rng.random(strip_length) < 0.2] -= rng.uniform(20, 120)
+            strips.append(np.round(strip, rng.choice([0, 3])).tolist())
+        no_outliers = rng.random(len(strips)) < 0.5
+
+        strip_matrix = np.full((len(strips), 12), np.nan)
+        for strip_no, strip in enumerate(strips):
+            strip_matrix[strip_no, : len(strip)] = strip
+        thresholds = image_instance_ops.get_local_thresholds(
+            strip_matrix, global_thr, no_outliers
+        )
+
+        expected_thresholds = [
+            image_instance_ops.get_local_threshold(strip, global_thr, no_outlier)
+            for strip, no_outlier in zip(strips, no_outliers)
+        ]
+        assert thresholds.tolist() == expected_thresholds
+
+
+def test_entry_import_skips_optional_dependencies():
+    lazy_modules = ["matplotlib", "pandas", "screeninfo", "src.processors.CropPage"]
+    code = (
+        "import sys; import src.entry; "
+        f"print([m for m in {lazy_modules} if m in sys.modules])"
+    )
+    # Note: a fresh interpreter, without the display probing env variable
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key != "OMR_CHECKER_CONTAINER"
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("[]")
+
+
+def test_stage_image_recorder_is_bounded_and_reuses_buffers():
+    image = np.full((100, 80), 7, np.uint8)
+    recorder = StageImageRecorder(save_image_level=2, display_height=50, max_images=2)
+    recorder.record(1, image)
+    # Levels above save_image_level are not recorded
+    recorder.record(3, image)
+    (buffer,) = recorder.get_images(1)
+    assert buffer.shape == (50, 40)
+    assert recorder.get_images(3) == []
+
+    recorder.start_sheet()
+    assert recorder.get_images(1) == []
+    recorder.record(1, image * 2)
+    (next_buffer,) = recorder.get_images(1)
+    assert next_buffer is buffer and (next_buffer == 14).all()
+
+    for _ in range(3):
+        recorder.record(2, image)
+    assert len(recorder.get_images(2)) == 2
+
+    disabled_recorder = StageImageRecorder(save_image_level=0, display_height=50)
+    disabled_recorder.record(1, image)
+    assert disabled_recorder.buffers == {}
+
+
+def test_async_image_writer_flushes_queued_images(tmp_path):
+    image = np.random.default_rng(0).integers(0, 255, (200, 100), dtype=np.uint8)
+    image_writer = AsyncImageWriter(threads=2, jpeg_quality=20)
+    for index in range(5):
+        image_writer.save_img(str(tmp_path.joinpath(f"{index}.jpg")), image)
+    image_writer.save_stack(str(tmp_path.joinpath("stack.png")), image, 50)
+    image_writer.close()
+
+    assert len(list(tmp_path.glob("*.jpg"))) == 5
+    assert cv2.imread(str(tmp_path.joinpath("stack.png"))).shape[:2] == (100, 50)
+    # Encoded with the configured quality
+    assert tmp_path.joinpath("0.jpg").stat().st_size < len(
+        cv2.imencode(".jpg", image)[1]
+    )
+
+    # Errors of the writer threads are raised on flushing
+    image_writer.save_img(str(tmp_path.joinpath("missing", "0.jpg")), None)
+    with pytest.raises(Exception):
+        image_writer.close()
+
+
+def test_decode_img_reduces_large_jpegs():
+    image = np.random.default_rng(0).integers(0, 255, (3000, 2400), dtype=np.uint8)
+    jpeg_data = cv2.imencode(".jpg", image)[1].tobytes()
+    png_data = cv2.imencode(".png", image)[1].tobytes()
+
+    assert ImageUtils.get_jpeg_dimensions(jpeg_data) == (2400, 3000)
+    assert ImageUtils.get_jpeg_dimensions(png_data) is None
+    assert ImageUtils.decode_img(jpeg_data).shape == (3000, 2400)
+    # Reduced by the largest factor that keeps the processing dimensions
+    assert ImageUtils.decode_img(jpeg_data, 300, 360).shape == (375, 300)
+    assert ImageUtils.decode_img(jpeg_data, 600, 700).shape == (750, 600)
+    assert ImageUtils.decode_img(jpeg_data, 666, 820).shape == (1500, 1200)
+    assert ImageUtils.decode_img(jpeg_data, 2000, 2800).shape == (3000, 2400)
+    assert ImageUtils.decode_img(png_data, 666, 820).shape == (3000, 2400)
@@ -0,0 +1,152 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.processor import (
+    TemplateRegistry,
+    process_and_get_result,
+    process_and_get_scored_result,
+)
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+from src.utils.cache import ResponseCache
+
+SAMPLE_IMAGE_PATH = Path("src", "tests", "test_samples", "sample1", "sample.png")
+
+
+def write_template(template_dir, template):
+    os.makedirs(template_dir.joinpath("templates"), exist_ok=True)
+    with open(template_dir.joinpath("templates", "sample1.json"), "w") as f:
+        json.dump(template, f)
+
+
+def test_template_registry_reuses_and_invalidates_entries(tmp_path):
+    write_template(tmp_path, TEMPLATE_BOILERPLATE)
+    registry = TemplateRegistry(tmp_path, tmp_path.joinpath("output"))
+
+    entry = registry.get("sample1")
+    assert registry.get("sample1") is entry
+
+    # Touching the file without changing its content keeps the entry
+    template_path = tmp_path.joinpath("templates", "sample1.json")
+    os.utime(template_path, ns=(0, 0))
+    assert registry.get("sample1") is entry
+
+    write_template(tmp_path, {**TEMPLATE_BOILERPLATE, "pageDimensions": [320, 400]})
+    updated_entry = registry.get("sample1")
+    assert updated_entry is not entry
+    assert updated_entry.template.page_dimensions == [320, 400]
+
+    registry.invalidate("sample1")
+    assert registry.get("sample1") is not updated_entry
+
+
+def test_process_and_get_result_caches_responses(mocker, tmp_path):
+    write_template(tmp_path, TEMPLATE_BOILERPLATE)
+    response_cache = ResponseCache(tmp_path.joinpath("cache"))
+    registry = TemplateRegistry(tmp_path, tmp_path.joinpath("output"), response_cache)
+    mocker.patch("src.processor.TEMPLATE_REGISTRY", registry)
+    mocker.patch("src.processor.RESPONSE_CACHE", response_cache)
+    file_data = np.fromfile(SAMPLE_IMAGE_PATH, dtype=np.uint8)
+
+    result = process_and_get_scored_result("sample1", file_data, "sample.png")
+    assert response_cache.misses == 1
+    omr_response, score = result
+    assert score == 0
+    # Keeps returning only the response, as before the scores were added
+    assert process_and_get_result("sample1", file_data, "sample.png") == omr_response
+    assert response_cache.hits == 1
+    assert len(response_cache.entries) == 1
+
+    # Changing the template invalidates the cached responses
+    write_template(tmp_path, {**TEMPLATE_BOILERPLATE, "bubbleDimensions": [20, 20]})
+    process_and_get_result("sample1", file_data, "sample.png")
+    assert response_cache.hits == 1
+    assert len(response_cache.entries) == 1
+    assert next(iter(response_cache.entries)).startswith(
+        registry.get("sample1").fingerprint
+    )
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    response_cache = ResponseCache(tmp_path, max_size=100)
+    for image_data in [b"a", b"b", b"c"]:
+        response_cache.put("fingerprint", image_data, {"q1": "A"}, 1.0)
+        # Use the first entry again
+        response_cache.get("fingerprint", b"a")
+
+    assert response_cache.get("fingerprint", b"a") == ({"q1": "A"}, 1.0)
+    assert response_cache.get("fingerprint", b"b") is None
+    # Reloaded from the disk
+    assert len(ResponseCache(tmp_path, max_size=100).entries) == 2
+
+
+def test_process_and_get_result_from_threads(mocker, tmp_path):
+    write_template(tmp_path, TEMPLATE_BOILERPLATE)
+    registry = TemplateRegistry(tmp_path, tmp_path.joinpath("output"))
+    mocker.patch("src.processor.TEMPLATE_REGISTRY", registry)
+    mocker.patch("src.processor.RESPONSE_CACHE.get", return_value=None)
+    mocker.patch("src.processor.RESPONSE_CACHE.put")
+    file_data = np.fromfile(SAMPLE_IMAGE_PATH, dtype=np.uint8)
+    serial_result = process_and_get_result("sample1", file_data, "sample.png")
+
+    # Calls for the same template share its registry entry
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(
+            executor.map(
+                lambda _: process_and_get_result("sample1", file_data, "sample.png"),
+                range(8),
+            )
+        )
+
+    assert results == [serial_result] * 8
+
+
+def test_process_and_get_result_flushes_images(mocker, tmp_path):
+    write_template(tmp_path, TEMPLATE_BOILERPLATE)
+    registry = TemplateRegistry(tmp_path, tmp_path.joinpath("output"))
+    mocker.patch("src.processor.TEMPLATE_REGISTRY", registry)
+    mocker.patch("src.processor.RESPONSE_CACHE.get", return_value=None)
+    mocker.patch("src.processor.RESPONSE_CACHE.put")
+    file_data = np.fromfile(SAMPLE_IMAGE_PATH, dtype=np.uint8)
+    image_writer = registry.get("sample1").template.image_instance_ops.image_writer
+    flush = mocker.spy(image_writer, "flush")
+
+    process_and_get_result("sample1", file_data, "sample.png")
+    flush.assert_called_once()
+    # The marked image is on the disk once the call returns
+    assert tmp_path.joinpath("output", "CheckedOMRs", "sample.png").exists()
+
+    # Errors of the writer threads are raised to the caller
+    mocker.patch(
+        "src.utils.image.ImageUtils.save_img", side_effect=OSError("disk full")
+    )
+    with pytest.raises(OSError):
+        process_and_get_result("sample1", file_data, "sample.png")
+
+
+def test_template_registry_closes_replaced_entries(mocker, tmp_path):
+    write_template(tmp_path, TEMPLATE_BOILERPLATE)
+    registry = TemplateRegistry(tmp_path, tmp_path.joinpath("output"))
+    entry = registry.get("sample1")
+    image_writer_close = mocker.spy(
+        entry.template.image_instance_ops.image_writer, "close"
+    )
+    results_writer_close = mocker.spy(entry.outputs_namespace.results_writer, "close")
+
+    write_template(tmp_path, {**TEMPLATE_BOILERPLATE, "pageDimensions": [320, 400]})
+    assert registry.get("sample1") is not entry
+    assert entry.closed
+    image_writer_close.assert_called_once()
+    results_writer_close.assert_called_once()
+    assert all(
+        sink.file.closed
+        for sink in entry.outputs_namespace.results_writer.sinks.values()
+    )
+
+    updated_entry = registry.get("sample1")
+    registry.invalidate("sample1")
+    assert updated_entry.closed
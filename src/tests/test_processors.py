@@ -0,0 +1,148 @@
+import json
+import shutil
+from pathlib import Path
+
+import cv2
+
+from src.entry import read_omr_file
+from src.template import Template
+from src.utils.parsing import open_config_with_defaults
+
+MARKERS_SAMPLE_PATH = Path("samples", "community", "UmarFarootAPS")
+MARKERS_SAMPLE_SCANS = [
+    MARKERS_SAMPLE_PATH.joinpath("scans", "scan-type-1.jpg"),
+    MARKERS_SAMPLE_PATH.joinpath("scans", "scan-type-2.jpg"),
+]
+ALIGNMENT_SAMPLE_PATH = Path("samples", "sample6")
+ALIGNMENT_SAMPLE_SCANS = sorted(
+    ALIGNMENT_SAMPLE_PATH.joinpath("doc-scans").glob("*.jpg")
+)
+
+
+def setup_markers_template(tmp_path, **marker_options):
+    with open(MARKERS_SAMPLE_PATH.joinpath("template.json")) as f:
+        template_json = json.load(f)
+    template_json["preProcessors"][0]["options"].update(marker_options)
+    template_path = tmp_path.joinpath("template.json")
+    with open(template_path, "w") as f:
+        json.dump(template_json, f)
+    shutil.copy(MARKERS_SAMPLE_PATH.joinpath("omr_marker.jpg"), tmp_path)
+
+    tuning_config = open_config_with_defaults(
+        MARKERS_SAMPLE_PATH.joinpath("config.json")
+    )
+    return Template(template_path, tuning_config)
+
+
+def read_markers_scans(template):
+    return [
+        template.image_instance_ops.apply_preprocessors(
+            str(scan_path),
+            cv2.imread(str(scan_path), cv2.IMREAD_GRAYSCALE),
+            template,
+        )
+        for scan_path in MARKERS_SAMPLE_SCANS * 2
+    ]
+
+
+def test_marker_scale_cache(tmp_path):
+    template = setup_markers_template(tmp_path)
+    expected_images = read_markers_scans(template)
+
+    cached_template = setup_markers_template(tmp_path, use_scale_cache=True)
+    images = read_markers_scans(cached_template)
+
+    crop_on_markers = cached_template.pre_processors[0]
+    hits, misses, _hit_rate = crop_on_markers.get_scale_cache_stats()
+    assert (hits, misses) == (3, 0)
+    for image, expected_image in zip(images, expected_images):
+        assert (image == expected_image).all()
+
+
+def test_marker_pyramid_matching(tmp_path):
+    template = setup_markers_template(tmp_path)
+    expected_images = read_markers_scans(template)
+
+    pyramid_template = setup_markers_template(tmp_path, use_pyramid_matching=True)
+    images = read_markers_scans(pyramid_template)
+
+    for image, expected_image in zip(images, expected_images):
+        assert (image == expected_image).all()
+
+
+def test_marker_regions_learned_from_first_sheets(tmp_path):
+    template = setup_markers_template(tmp_path)
+    expected_images = read_markers_scans(template)
+
+    regions_template = setup_markers_template(tmp_path, learn_marker_regions=2)
+    images = read_markers_scans(regions_template)
+
+    crop_on_markers = regions_template.pre_processors[0]
+    assert crop_on_markers.marker_regions is not None
+    assert crop_on_markers.region_fallbacks == 0
+    for image, expected_image in zip(images, expected_images):
+        assert (image == expected_image).all()
+
+
+def test_marker_regions_fallback_to_full_quad(tmp_path):
+    template = setup_markers_template(tmp_path)
+    expected_images = read_markers_scans(template)
+
+    # Regions that miss all the markers
+    regions_template = setup_markers_template(
+        tmp_path, marker_regions=[[0.4, 0.4, 0.45, 0.45]] * 4
+    )
+    images = read_markers_scans(regions_template)
+
+    assert regions_template.pre_processors[0].region_fallbacks > 0
+    for image, expected_image in zip(images, expected_images):
+        assert (image == expected_image).all()
+
+
+def setup_alignment_template(tmp_path, **alignment_options):
+    with open(ALIGNMENT_SAMPLE_PATH.joinpath("template_fb_align.json")) as f:
+        template_json = json.load(f)
+    for pre_processor in template_json["preProcessors"]:
+        if pre_processor["name"] == "FeatureBasedAlignment":
+            pre_processor["options"].update(alignment_options)
+    template_path = tmp_path.joinpath("template.json")
+    with open(template_path, "w") as f:
+        json.dump(template_json, f)
+    shutil.copy(ALIGNMENT_SAMPLE_PATH.joinpath("reference.png"), tmp_path)
+
+    tuning_config = open_config_with_defaults(
+        ALIGNMENT_SAMPLE_PATH.joinpath("config.json")
+    )
+    return Template(template_path, tuning_config)
+
+
+def read_alignment_responses(template, save_dir):
+    return [
+        read_omr_file(scan_path, files_counter, template, save_dir)[1]
+        for files_counter, scan_path in enumerate(ALIGNMENT_SAMPLE_SCANS)
+    ]
+
+
+def test_feature_alignment_flann_matcher(tmp_path):
+    template = setup_alignment_template(tmp_path)
+    expected_responses = read_alignment_responses(template, tmp_path)
+
+    flann_template = setup_alignment_template(tmp_path, useFlannMatcher=True)
+    responses = read_alignment_responses(flann_template, tmp_path)
+
+    assert [response["Roll"] for response in expected_responses] == [
+        "A0188877Y",
+        "A0203959W",
+        "A0204729A",
+    ]
+    assert responses == expected_responses
+
+
+def test_feature_alignment_detection_scale(tmp_path):
+    template = setup_alignment_template(tmp_path)
+    expected_responses = read_alignment_responses(template, tmp_path)
+
+    scaled_template = setup_alignment_template(tmp_path, detectionScale=0.5)
+    responses = read_alignment_responses(scaled_template, tmp_path)
+
+    assert responses == expected_responses
@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+
+from src.utils.manifest import RunManifest
+from src.utils.results import ResultsWriter
+
+COLUMNS = ["file_id", "input_path", "output_path", "score", "q1"]
+
+
+def read_csv(file_path):
+    return pd.read_csv(file_path, dtype=str, na_filter=False).values.tolist()
+
+
+def test_results_writer_flushes_in_batches(tmp_path):
+    results_path = tmp_path.joinpath("Results.csv")
+    results_writer = ResultsWriter({"Results": results_path}, COLUMNS, batch_size=2)
+
+    results_writer.write_row("Results", ["a.jpg", "in/a.jpg", "out/a.jpg", 0, "A"])
+    assert read_csv(results_path) == []
+
+    results_writer.write_row("Results", ["b.jpg", "in/b.jpg", "out/b.jpg", 1.5, ""])
+    results_writer.write_row("Results", ["c.jpg", "in/c.jpg", "out/c.jpg", 2, "C"])
+    assert len(read_csv(results_path)) == 2
+
+    results_writer.close()
+    assert read_csv(results_path) == [
+        ["a.jpg", "in/a.jpg", "out/a.jpg", "0", "A"],
+        ["b.jpg", "in/b.jpg", "out/b.jpg", "1.5", ""],
+        ["c.jpg", "in/c.jpg", "out/c.jpg", "2", "C"],
+    ]
+
+    # Appends to the existing file without repeating the header
+    results_writer = ResultsWriter({"Results": results_path}, COLUMNS)
+    results_writer.write_row("Results", ["d.jpg", "in/d.jpg", "out/d.jpg", 0, "D"])
+    results_writer.close()
+    assert len(read_csv(results_path)) == 4
+
+
+def test_results_writer_parquet_columns(tmp_path):
+    pytest.importorskip("pyarrow")
+    results_path = tmp_path.joinpath("Results.parquet")
+    # The second run appends to the existing file
+    for row in [
+        ["a.jpg", "in/a.jpg", "out/a.jpg", 0, "A"],
+        ["b.jpg", "in/b.jpg", "out/b.jpg", "NA", ""],
+    ]:
+        results_writer = ResultsWriter(
+            {"Results": results_path}, COLUMNS, results_format="parquet"
+        )
+        results_writer.write_row("Results", row)
+        results_writer.close()
+
+    results = pd.read_parquet(results_path)
+    assert results["score"].dtype == "float64"
+    assert results["q1"].dtype == "category"
+    assert results["file_id"].tolist() == ["a.jpg", "b.jpg"]
+    assert results["score"].isna().tolist() == [False, True]
+
+
+def test_manifest_discards_rows_after_last_checkpoint(tmp_path):
+    input_paths = []
+    for file_id in ["a", "b", "c"]:
+        input_path = tmp_path.joinpath(f"{file_id}.jpg")
+        input_path.write_bytes(file_id.encode())
+        input_paths.append(input_path)
+    results_path = tmp_path.joinpath("Results.csv")
+    manifest_path = tmp_path.joinpath("Manifest.jsonl")
+
+    manifest = RunManifest(manifest_path)
+    results_writer = ResultsWriter(
+        {"Results": results_path}, COLUMNS, batch_size=2, manifest=manifest
+    )
+    for input_path in input_paths:
+        results_writer.write_row(
+            "Results", [input_path.name, input_path, "", 0, "A"], input_path
+        )
+    # Interrupted while writing the third row
+    with open(results_path, "a") as f:
+        f.write('"c.jpg","in/c')
+    with open(manifest_path, "a") as f:
+        f.write('{"input_path": ')
+
+    manifest = RunManifest(manifest_path)
+    assert manifest.get_pending_files(input_paths) == input_paths[2:]
+    assert [row[0] for row in read_csv(results_path)] == ["a.jpg", "b.jpg"]
+
+    # A changed file is processed again
+    input_paths[0].write_bytes(b"changed")
+    assert manifest.get_pending_files(input_paths) == [input_paths[0], input_paths[2]]
@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from threading import Lock
+
+from src.logger import logger
+from src.utils.file import OMR_FILE_EXTENSIONS
+
+
+def is_omr_file_name(name):
+    return os.path.splitext(name)[1].lower() in OMR_FILE_EXTENSIONS
+
+
+def get_json_strings(content):
+    """Yields all the string values of a loaded json, recursively"""
+    if isinstance(content, str):
+        yield content
+    elif isinstance(content, dict):
+        for value in content.values():
+            yield from get_json_strings(value)
+    elif isinstance(content, list):
+        for value in content:
+            yield from get_json_strings(value)
+
+
+class ArchiveListing:
+    """Same interface as DirectoryListing, for a directory inside an archive"""
+
+    def __init__(self, omr_files, subdirs):
+        self.omr_files = omr_files
+        self.subdirs = subdirs
+
+    def __iter__(self):
+        return iter(self.omr_files)
+
+
+class ArchiveInput:
+    """Reads the omr files of a zip or tar archive without extracting them.
+
+    A member is addressed as '<archive path>/<member name>', so the archive works
+    like an input directory. The other members (the template, config and
+    evaluation jsons, the answer key csvs) and the images referenced from the
+    jsons (e.g. the omr markers) are extracted into a temporary directory, as
+    the templates and pre-processors load them from the disk.
+    """
+
+    def __init__(self, archive_path):
+        self.archive_path = Path(archive_path)
+        self.lock = Lock()
+        if zipfile.is_zipfile(archive_path):
+            self.archive = zipfile.ZipFile(archive_path)
+            members = [
+                (member.filename, member)
+                for member in self.archive.infolist()
+                if not member.is_dir()
+            ]
+        elif tarfile.is_tarfile(archive_path):
+            self.archive = tarfile.open(archive_path)
+            members = [
+                (member.name, member)
+                for member in self.archive.getmembers()
+                if member.isfile()
+            ]
+        else:
+            raise Exception(
+                f"Given input file is not a zip or tar archive: '{archive_path}'"
+            )
+
+        # {member name: member info} of the files
+        self.members = {}
+        # {directory name: ([omr file names], [subdirectory names])}
+        self.directories = {"": ([], [])}
+        for name, member in members:
+            member_path = PurePosixPath(name)
+            if member_path.is_absolute() or ".." in member_path.parts:
+                logger.warning(f"Skipping unsafe archive member: '{name}'")
+                continue
+            if member_path.parts[0] == "__MACOSX" or member_path.name.startswith("._"):
+                # Resource forks added by the macOS archiver
+                continue
+            name = member_path.as_posix()
+            self.members[name] = member
+            if is_omr_file_name(name):
+                self.add_directory(member_path.parent)[0].append(name)
+            else:
+                self.add_directory(member_path.parent)
+
+        self.extract_dir = Path(tempfile.mkdtemp(prefix="omrchecker_"))
+        self.extract_assets()
+        logger.info(f"Opened archive '{archive_path}' with {len(self.members)} file(s)")
+
+    def add_directory(self, dir_path):
+        dir_name = "" if str(dir_path) == "." else dir_path.as_posix()
+        if dir_name not in self.directories:
+            self.directories[dir_name] = ([], [])
+            self.add_directory(dir_path.parent)[1].append(dir_name)
+        return self.directories[dir_name]
+
+    def extract_assets(self):
+        asset_names = [name for name in self.members if not is_omr_file_name(name)]
+        for name in asset_names:
+            self.extract(name)
+        # Extract the images referenced from the jsons, relative to the json
+        for name in asset_names:
+            if not name.endswith(".json"):
+                continue
+            with open(self.extract_dir.joinpath(name)) as f:
+                try:
+                    content = json.load(f)
+                except json.decoder.JSONDecodeError:
+                    continue
+            json_dir = PurePosixPath(name).parent
+            for value in get_json_strings(content):
+                referenced_name = json_dir.joinpath(value).as_posix()
+                if (
+                    is_omr_file_name(referenced_name)
+                    and referenced_name in self.members
+                ):
+                    self.extract(referenced_name)
+
+    def extract(self, name):
+        extract_path = self.extract_dir.joinpath(name)
+        os.makedirs(extract_path.parent, exist_ok=True)
+        with open(extract_path, "wb") as f:
+            f.write(self.read_member(name))
+
+    def read_member(self, name):
+        member = self.members[name]
+        with self.lock:
+            if isinstance(self.archive, zipfile.ZipFile):
+                return self.archive.read(member)
+            return self.archive.extractfile(member).read()
+
+    def get_member_name(self, path):
+        name = Path(path).relative_to(self.archive_path).as_posix()
+        return "" if name == "." else name
+
+    def read(self, file_path):
+        """Returns the content of an omr file of the archive"""
+        return self.read_member(self.get_member_name(file_path))
+
+    def get_local_dir(self, curr_dir):
+        """Returns the directory with the extracted members of an archive directory"""
+        return self.extract_dir.joinpath(self.get_member_name(curr_dir))
+
+    def get_input_path(self, local_path):
+        """Returns the archive path of an extracted member"""
+        local_path = Path(local_path)
+        if self.extract_dir not in local_path.parents:
+            return local_path
+        return self.archive_path.joinpath(local_path.relative_to(self.extract_dir))
+
+    def get_listing(self, curr_dir):
+        omr_file_names, subdir_names = self.directories.get(
+            self.get_member_name(curr_dir), ([], [])
+        )
+        return ArchiveListing(
+            [self.archive_path.joinpath(name) for name in omr_file_names],
+            [self.archive_path.joinpath(name) for name in subdir_names],
+        )
+
+    def close(self):
+        self.archive.close()
+        shutil.rmtree(self.extract_dir, ignore_errors=True)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from src.logger import logger
+
+
+class ResponseCache:
+    """On-disk cache of the omr responses, keyed by image content and template fingerprint.
+
+    Each entry is a json file named '<fingerprint>_<image sha256>.json'. The least
+    recently used entries are evicted once the cache grows above `max_size` bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = Lock()
+        # {entry_name: size} from the least to the most recently used entry
+        self.entries = OrderedDict()
+        self.total_size = 0
+        self.hits, self.misses = 0, 0
+        if os.path.exists(cache_dir):
+            self.load_entries()
+
+    def load_entries(self):
+        cache_files = [
+            entry
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".json")
+        ]
+        for entry in sorted(cache_files, key=lambda entry: entry.stat().st_mtime_ns):
+            size = entry.stat().st_size
+            self.entries[entry.name] = size
+            self.total_size += size
+
+    @staticmethod
+    def get_entry_name(fingerprint, image_data):
+        image_hash = hashlib.sha256(image_data).hexdigest()
+        return f"{fingerprint}_{image_hash}.json"
+
+    def get(self, fingerprint, image_data):
+        """Returns the cached (omr_response, score) or None"""
+        entry_name = self.get_entry_name(fingerprint, image_data)
+        with self.lock:
+            if entry_name not in self.entries:
+                self.misses += 1
+                return None
+            entry_path = os.path.join(self.cache_dir, entry_name)
+            try:
+                with open(entry_path) as f:
+                    cached = json.load(f)
+            except (OSError, json.decoder.JSONDecodeError):
+                # Removed or partially written entry
+                self.remove_entry(entry_name)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_name)
+            # Keep the usage order across restarts
+            os.utime(entry_path)
+            self.hits += 1
+            return cached["omr_response"], cached["score"]
+
+    def put(self, fingerprint, image_data, omr_response, score):
+        entry_name = self.get_entry_name(fingerprint, image_data)
+        content = json.dumps({"omr_response": omr_response, "score": score}).encode()
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry_path = os.path.join(self.cache_dir, entry_name)
+            partial_path = f"{entry_path}.partial"
+            with open(partial_path, "wb") as f:
+                f.write(content)
+            os.replace(partial_path, entry_path)
+            if entry_name in self.entries:
+                self.total_size -= self.entries[entry_name]
+            self.entries[entry_name] = len(content)
+            self.entries.move_to_end(entry_name)
+            self.total_size += len(content)
+            while self.total_size > self.max_size and len(self.entries) > 1:
+                oldest_entry_name = next(iter(self.entries))
+                self.remove_entry(oldest_entry_name)
+
+    def invalidate(self, fingerprint=None):
+        """Removes the entries of the given template fingerprint, or all entries"""
+        with self.lock:
+            entry_names = [
+                entry_name
+                for entry_name in self.entries
+                if fingerprint is None or entry_name.startswith(f"{fingerprint}_")
+            ]
+            for entry_name in entry_names:
+                self.remove_entry(entry_name)
+        logger.info(f"Invalidated {len(entry_names)} cached response(s)")
+
+    def remove_entry(self, entry_name):
+        self.total_size -= self.entries.pop(entry_name)
+        entry_path = os.path.join(self.cache_dir, entry_name)
+        if os.path.exists(entry_path):
+            os.remove(entry_path)
@@ -1,12 +1,12 @@
 import argparse
+import hashlib
 import json
 import os
-from csv import QUOTE_NONNUMERIC
+from pathlib import Path
 from time import localtime, strftime
 
-import pandas as pd
-
 from src.logger import logger
+from src.utils.results import ResultsWriter
 
 
 def load_json(path, **rest):
@@ -19,6 +19,37 @@ def load_json(path, **rest):
     return loaded
 
 
+def get_file_fingerprint(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+OMR_FILE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+
+class DirectoryListing:
+    """Lists the omr files and the subdirectories of a directory in one os.scandir pass.
+
+    Iterating yields the omr files lazily in the listing order, and collects the
+    subdirectories into `subdirs` along the way.
+    """
+
+    def __init__(self, curr_dir):
+        self.curr_dir = curr_dir
+        self.subdirs = []
+
+    def __iter__(self):
+        with os.scandir(self.curr_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self.subdirs.append(Path(entry.path))
+                elif (
+                    os.path.splitext(entry.name)[1].lower() in OMR_FILE_EXTENSIONS
+                    and entry.is_file()
+                ):
+                    yield Path(entry.path)
+
+
 class Paths:
     def __init__(self, output_dir):
         self.output_dir = output_dir
@@ -50,7 +81,9 @@ def setup_dirs_for_paths(paths):
             os.makedirs(save_output_dir)
 
 
-def setup_outputs_for_template(paths, template):
+def setup_outputs_for_template(
+    paths, template, results_batch_size=1, results_format="csv", manifest=None
+):
     # TODO: consider moving this into a class instance
     ns = argparse.Namespace()
     logger.info("Checking Files...")
@@ -66,29 +99,19 @@ def setup_outputs_for_template(paths, template):
         "score",
     ] + template.output_columns
     ns.OUTPUT_SET = []
-    ns.files_obj = {}
     TIME_NOW_HRS = strftime("%I%p", localtime())
     ns.filesMap = {
-        "Results": os.path.join(paths.results_dir, f"Results_{TIME_NOW_HRS}.csv"),
-        "MultiMarked": os.path.join(paths.manual_dir, "MultiMarkedFiles.csv"),
-        "Errors": os.path.join(paths.manual_dir, "ErrorFiles.csv"),
+        "Results": os.path.join(
+            paths.results_dir, f"Results_{TIME_NOW_HRS}.{results_format}"
+        ),
+        "MultiMarked": os.path.join(
+            paths.manual_dir, f"MultiMarkedFiles.{results_format}"
+        ),
+        "Errors": os.path.join(paths.manual_dir, f"ErrorFiles.{results_format}"),
     }
-
-    for file_key, file_name in ns.filesMap.items():
-        if not os.path.exists(file_name):
-            logger.info(f"Created new file: '{file_name}'")
-            # moved handling of files to pandas csv writer
-            ns.files_obj[file_key] = file_name
-            # Create Header Columns
-            pd.DataFrame([ns.sheetCols], dtype=str).to_csv(
-                ns.files_obj[file_key],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
-        else:
-            logger.info(f"Present : appending to '{file_name}'")
-            ns.files_obj[file_key] = open(file_name, "a")
+    # Note: the writer keeps the files open, close it after processing the files
+    ns.results_writer = ResultsWriter(
+        ns.filesMap, ns.sheetCols, results_batch_size, results_format, manifest
+    )
 
     return ns
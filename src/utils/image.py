@@ -6,23 +6,107 @@
  Github: https://github.com/Udayraj123
 
 """
+import os
+import struct
+from functools import lru_cache
+from queue import Queue
+from threading import Thread
+
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 
 from src.logger import logger
 
-plt.rcParams["figure.figsize"] = (10.0, 8.0)
 CLAHE_HELPER = cv2.createCLAHE(clipLimit=5.0, tileGridSize=(8, 8))
+# Most images recorded per level of the debug image stacks of a sheet
+MAX_STAGE_IMAGES = 10
+# Most images waiting in the queue of the image writer
+IMAGE_WRITER_QUEUE_SIZE = 16
+# Decode flags that downscale jpegs while decoding, from the largest factor
+REDUCED_GRAYSCALE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+]
+# Start of frame markers of a jpeg, which hold its dimensions
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+
+@lru_cache(maxsize=None)
+def get_pyplot():
+    """Imports matplotlib on the first plot, as it is slow to import"""
+    import matplotlib.pyplot as plt
+
+    plt.rcParams["figure.figsize"] = (10.0, 8.0)
+    return plt
 
 
 class ImageUtils:
     """A Static-only Class to hold common image processing utilities & wrappers over OpenCV functions"""
 
     @staticmethod
-    def save_img(path, final_marked):
+    def save_img(path, final_marked, params=None):
         logger.info(f"Saving Image to '{path}'")
-        cv2.imwrite(path, final_marked)
+        cv2.imwrite(path, final_marked, params or [])
+
+    @staticmethod
+    def get_jpeg_dimensions(file_data):
+        """Returns the (width, height) from the frame header of a jpeg, or None"""
+        data = memoryview(file_data).cast("B")
+        if data[:2] != b"\xff\xd8":
+            return None
+        index = 2
+        while index + 9 <= len(data):
+            if data[index] != 0xFF:
+                return None
+            marker = data[index + 1]
+            if marker == 0xFF:
+                # Fill byte
+                index += 1
+            elif marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack_from(">HH", data, index + 5)
+                return width, height
+            elif marker in JPEG_STANDALONE_MARKERS:
+                index += 2
+            else:
+                (segment_length,) = struct.unpack_from(">H", data, index + 2)
+                index += 2 + segment_length
+        return None
+
+    @staticmethod
+    def get_decode_flag(file_data, min_width, min_height):
+        """Returns the flag to decode a grayscale image no smaller than the given size.
+
+        Large jpegs are downscaled by libjpeg while decoding, which is several
+        times faster and lighter than decoding them at full resolution.
+        """
+        dimensions = ImageUtils.get_jpeg_dimensions(file_data)
+        if dimensions is None:
+            return cv2.IMREAD_GRAYSCALE
+        # Note: the exif orientation may swap the width and height
+        long_side, short_side = max(dimensions), min(dimensions)
+        min_long_side, min_short_side = (
+            max(min_width, min_height),
+            min(min_width, min_height),
+        )
+        for factor, flag in REDUCED_GRAYSCALE_FLAGS:
+            if (
+                long_side // factor >= min_long_side
+                and short_side // factor >= min_short_side
+            ):
+                return flag
+        return cv2.IMREAD_GRAYSCALE
+
+    @staticmethod
+    def decode_img(file_data, min_width=None, min_height=None):
+        """Decodes a grayscale image, at a reduced resolution if a minimum size is given"""
+        file_data = np.frombuffer(file_data, np.uint8)
+        flag = cv2.IMREAD_GRAYSCALE
+        if min_width is not None and min_height is not None:
+            flag = ImageUtils.get_decode_flag(file_data, min_width, min_height)
+        return cv2.imdecode(file_data, flag)
 
     @staticmethod
     def resize_util(img, u_width, u_height=None):
@@ -153,3 +237,131 @@ class ImageUtils:
 
         # return the ordered coordinates
         return rect
+
+
+class StageImageRecorder:
+    """Records the intermediate images of a sheet for its debug image stacks.
+
+    Only the levels up to save_image_level are recorded, so that recording is a
+    no-op at level 0. The images are resized to the display height as they are
+    recorded, into buffers which are reused by the next sheets. At most
+    `max_images` images are kept per level.
+    """
+
+    def __init__(self, save_image_level, display_height, max_images=MAX_STAGE_IMAGES):
+        self.save_image_level = save_image_level
+        self.display_height = int(display_height)
+        self.max_images = max_images
+        # {level: [buffer]}, of which the current sheet uses the first counts[level]
+        self.buffers = {level: [] for level in range(1, save_image_level + 1)}
+        self.counts = dict.fromkeys(self.buffers, 0)
+
+    def start_sheet(self):
+        """Discards the images of the previous sheet"""
+        for level in self.counts:
+            self.counts[level] = 0
+
+    def record(self, level, img):
+        level = int(level)
+        if level not in self.counts:
+            return
+        count = self.counts[level]
+        if count >= self.max_images:
+            logger.warning(
+                f"Skipping the debug image {count + 1} of level {level}, at most {self.max_images} are saved"
+            )
+            return
+        h, w = img.shape[:2]
+        size = (int(w * self.display_height / h), self.display_height)
+        resized_shape = (size[1], size[0]) + img.shape[2:]
+        buffers = self.buffers[level]
+        if count == len(buffers):
+            buffers.append(cv2.resize(img, size))
+        elif (
+            buffers[count].shape == resized_shape and buffers[count].dtype == img.dtype
+        ):
+            cv2.resize(img, size, dst=buffers[count])
+        else:
+            buffers[count] = cv2.resize(img, size)
+        self.counts[level] = count + 1
+
+    def get_images(self, level):
+        """Returns the recorded images of the current sheet"""
+        return self.buffers.get(level, [])[: self.counts.get(level, 0)]
+
+
+class AsyncImageWriter:
+    """Encodes and writes the output images from background threads.
+
+    At most IMAGE_WRITER_QUEUE_SIZE images wait in the queue, saving blocks
+    beyond that. The threads are started on the first save and stopped on
+    close. With 0 threads, the images are written synchronously.
+    """
+
+    def __init__(self, threads=2, jpeg_quality=95, png_compression=3):
+        self.threads_count = threads
+        self.encode_params = {
+            ".jpg": [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
+            ".jpeg": [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
+            ".png": [cv2.IMWRITE_PNG_COMPRESSION, png_compression],
+        }
+        self.queue = Queue(maxsize=IMAGE_WRITER_QUEUE_SIZE)
+        self.threads = []
+        self.errors = []
+
+    def save_img(self, path, img):
+        """Saves the image, which must not be modified afterwards"""
+        self.submit(self.write_image, path, img)
+
+    def save_stack(self, path, stack, width):
+        """Saves the stacked images, resized to the width"""
+        self.submit(self.write_stack, path, stack, width)
+
+    def submit(self, *task):
+        if self.threads_count == 0:
+            function, *args = task
+            function(*args)
+            return
+        if not self.threads:
+            self.threads = [
+                Thread(target=self.write_images, daemon=True)
+                for _ in range(self.threads_count)
+            ]
+            for thread in self.threads:
+                thread.start()
+        self.queue.put(task)
+
+    def write_images(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                function, *args = task
+                function(*args)
+            except Exception as error:
+                self.errors.append(error)
+            finally:
+                self.queue.task_done()
+
+    def write_image(self, path, img):
+        extension = os.path.splitext(path)[1].lower()
+        ImageUtils.save_img(path, img, self.encode_params.get(extension))
+
+    def write_stack(self, path, stack, width):
+        self.write_image(path, ImageUtils.resize_util(stack, width))
+
+    def flush(self):
+        """Waits for the queued images to be written"""
+        self.queue.join()
+        if self.errors:
+            error, self.errors = self.errors[0], []
+            raise error
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.flush()
@@ -2,22 +2,28 @@ import os
 from dataclasses import dataclass
 
 import cv2
-from screeninfo import get_monitors, Monitor
 
 from src.logger import logger
 from src.utils.image import ImageUtils
 
-# If running in a container, make a fake monitor
-monitor_window = (
-    Monitor(0, 0, 1000, 1000, 100, 100, "FakeMonitor", False)
-    if os.environ.get("OMR_CHECKER_CONTAINER")
-    else get_monitors()[0]
-)
+
+def get_monitor_window():
+    # Note: the display is probed only when showing the first image
+    from screeninfo import Monitor, get_monitors
+
+    # If running in a container, make a fake monitor
+    return (
+        Monitor(0, 0, 1000, 1000, 100, 100, "FakeMonitor", False)
+        if os.environ.get("OMR_CHECKER_CONTAINER")
+        else get_monitors()[0]
+    )
+
 
 @dataclass
 class ImageMetrics:
     # TODO: Move TEXT_SIZE, etc here and find a better class name
-    window_width, window_height = monitor_window.width, monitor_window.height
+    # Set from the monitor on showing the first image
+    window_width, window_height = None, None
     # for positioning image windows
     window_x, window_y = 0, 0
     reset_pos = [0, 0]
@@ -43,6 +49,11 @@ class InteractionUtils:
         else:
             img = origin
 
+        if image_metrics.window_width is None:
+            monitor_window = get_monitor_window()
+            image_metrics.window_width = monitor_window.width
+            image_metrics.window_height = monitor_window.height
+
         cv2.imshow(name, img)
 
         if reset_pos:
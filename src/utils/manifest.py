@@ -0,0 +1,109 @@
+import json
+import os
+
+from src.logger import logger
+from src.utils.file import get_file_fingerprint
+
+
+class RunManifest:
+    """Append-only record of the input files processed into an output directory.
+
+    Each line is either a processed file entry or a checkpoint holding the sizes
+    of the results files. A checkpoint is written after the results are flushed,
+    and commits the entries before it. On loading, anything written after the
+    last checkpoint, including partially written rows of the results files,
+    is truncated so that those files are processed again.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        # {input_path: (sha256, outcome)} of the committed files
+        self.processed_files = {}
+        self.pending_records = []
+        self.load()
+        self.file = open(manifest_path, "a")
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        committed_size, read_size = 0, 0
+        uncommitted_files, checkpoint_sizes = {}, {}
+        with open(self.manifest_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A partially written line
+                    break
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    break
+                read_size += len(line)
+                if "checkpoint" in record:
+                    self.processed_files.update(uncommitted_files)
+                    uncommitted_files = {}
+                    checkpoint_sizes.update(record["checkpoint"])
+                    committed_size = read_size
+                else:
+                    uncommitted_files[record["input_path"]] = (
+                        record["sha256"],
+                        record["outcome"],
+                    )
+
+        os.truncate(self.manifest_path, committed_size)
+        for file_path, size in checkpoint_sizes.items():
+            if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                logger.warning(
+                    f"Discarding the rows written after the last checkpoint in '{file_path}'"
+                )
+                os.truncate(file_path, size)
+        logger.info(
+            f"Loaded manifest '{self.manifest_path}' with {len(self.processed_files)} processed file(s)"
+        )
+
+    def is_processed(self, file_path):
+        processed_file = self.processed_files.get(str(file_path))
+        if processed_file is None:
+            return False
+        # Process the file again if its content has changed
+        return processed_file[0] == get_file_fingerprint(file_path)
+
+    def get_pending_files(self, omr_files):
+        pending_files = [f for f in omr_files if not self.is_processed(f)]
+        skipped_count = len(omr_files) - len(pending_files)
+        if skipped_count > 0:
+            logger.info(f"Resuming: skipping {skipped_count} processed file(s)")
+        return pending_files
+
+    def iter_pending_files(self, omr_files):
+        """Lazy variant of get_pending_files, for the streamed files"""
+        skipped_count = 0
+        for file_path in omr_files:
+            if self.is_processed(file_path):
+                skipped_count += 1
+                continue
+            yield file_path
+        if skipped_count > 0:
+            logger.info(f"Resuming: skipped {skipped_count} processed file(s)")
+
+    def add_file(self, file_path, outcome):
+        record = {
+            "input_path": str(file_path),
+            "sha256": get_file_fingerprint(file_path),
+            "outcome": outcome,
+        }
+        self.pending_records.append(record)
+
+    def checkpoint(self, file_sizes):
+        """Commits the added files, to be called once their rows are written"""
+        records = self.pending_records + [{"checkpoint": file_sizes}]
+        self.file.write("".join(json.dumps(record) + "\n" for record in records))
+        self.file.flush()
+        for record in self.pending_records:
+            self.processed_files[record["input_path"]] = (
+                record["sha256"],
+                record["outcome"],
+            )
+        self.pending_records = []
+
+    def close(self):
+        self.file.close()
@@ -7,6 +7,7 @@ from dotmap import DotMap
 
 from src.constants import FIELD_LABEL_NUMBER_REGEX
 from src.defaults import CONFIG_DEFAULTS, TEMPLATE_DEFAULTS
+from src.logger import logger
 from src.schemas.constants import FIELD_STRING_REGEX_GROUPS
 from src.utils.file import load_json
 from src.utils.validations import (
@@ -52,7 +53,25 @@ def open_config_with_defaults(config_path):
     )
     validate_config_json(user_tuning_config, config_path)
     # https://github.com/drgrib/dotmap/issues/74
-    return DotMap(user_tuning_config, _dynamic=False)
+    tuning_config = DotMap(user_tuning_config, _dynamic=False)
+    if tuning_config.outputs.headless:
+        return get_headless_config(tuning_config)
+    return tuning_config
+
+
+def get_headless_config(tuning_config):
+    """Returns a copy of the config which only computes the responses"""
+    outputs = tuning_config.outputs
+    if outputs.show_image_level > 0 or outputs.save_image_level > 0:
+        logger.warning(
+            "Ignoring 'show_image_level' and 'save_image_level' in the headless mode"
+        )
+    headless_config = DotMap(tuning_config.toDict(), _dynamic=False)
+    headless_config.outputs.headless = True
+    headless_config.outputs.show_image_level = 0
+    headless_config.outputs.save_image_level = 0
+    headless_config.outputs.save_detections = False
+    return headless_config
 
 
 def open_template_with_defaults(template_path):
@@ -0,0 +1,236 @@
+import csv
+import os
+from queue import Queue
+from threading import Thread
+
+from src.logger import logger
+
+# Typed columns of the columnar results, the remaining columns are responses
+STRING_COLUMNS = ["file_id", "input_path", "output_path"]
+FLOAT_COLUMNS = ["score"]
+
+
+class CsvResultsSink:
+    """Appends rows to a csv file that is kept open for the whole run.
+
+    Rows are buffered until the next flush.
+    """
+
+    # The written size of the file can be checkpointed
+    supports_checkpoints = True
+
+    def __init__(self, file_path, columns):
+        self.file_path = file_path
+        self.rows = []
+        file_exists = os.path.exists(file_path)
+        if file_exists:
+            logger.info(f"Present : appending to '{file_path}'")
+        else:
+            logger.info(f"Created new file: '{file_path}'")
+        self.file = open(file_path, "a", newline="")
+        # Note: all values are written as strings, hence always quoted
+        self.writer = csv.writer(
+            self.file, quoting=csv.QUOTE_NONNUMERIC, lineterminator=os.linesep
+        )
+        if not file_exists:
+            # Create Header Columns
+            self.writer.writerow(columns)
+            self.file.flush()
+
+    def write_row(self, row):
+        self.rows.append([str(value) for value in row])
+
+    def flush(self):
+        if self.rows:
+            self.writer.writerows(self.rows)
+            self.rows = []
+        self.file.flush()
+
+    def get_size(self):
+        return self.file.tell()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class ParquetResultsSink:
+    """Streams rows into a parquet file, one row group per flush.
+
+    The score is stored as a float and the responses as categorical columns.
+    As parquet files cannot be appended to, the rows of an existing file are
+    copied into a new file which replaces it on close.
+    Note: the file is complete only after the sink is closed.
+    """
+
+    supports_checkpoints = False
+
+    def __init__(self, file_path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception(
+                "The parquet results format requires pyarrow, install it using 'pip install pyarrow'"
+            )
+        self.pa = pa
+        self.file_path = file_path
+        self.columns = columns
+        self.rows = []
+        self.schema = pa.schema(
+            [(column, self.get_column_type(column)) for column in columns]
+        )
+        self.partial_path = f"{file_path}.partial"
+        self.writer = pq.ParquetWriter(self.partial_path, self.schema)
+        if os.path.exists(file_path):
+            logger.info(f"Present : appending to '{file_path}'")
+            existing_file = pq.ParquetFile(file_path)
+            for row_group in range(existing_file.num_row_groups):
+                self.writer.write_table(
+                    existing_file.read_row_group(row_group).cast(self.schema)
+                )
+        else:
+            logger.info(f"Created new file: '{file_path}'")
+
+    def get_column_type(self, column):
+        pa = self.pa
+        if column in STRING_COLUMNS:
+            return pa.string()
+        if column in FLOAT_COLUMNS:
+            return pa.float64()
+        # Categorical responses
+        return pa.dictionary(pa.int32(), pa.string())
+
+    @staticmethod
+    def get_float(value):
+        try:
+            return float(value)
+        except ValueError:
+            # "NA" scores
+            return None
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+        pa = self.pa
+        arrays = []
+        for index, column in enumerate(self.columns):
+            values = [row[index] for row in self.rows]
+            if column in FLOAT_COLUMNS:
+                array = pa.array(map(self.get_float, values), pa.float64())
+            else:
+                array = pa.array(map(str, values), pa.string())
+                if column not in STRING_COLUMNS:
+                    array = array.dictionary_encode()
+            arrays.append(array)
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+            os.replace(self.partial_path, self.file_path)
+
+
+RESULTS_SINKS = {
+    "csv": CsvResultsSink,
+    "parquet": ParquetResultsSink,
+}
+
+
+class ResultsWriter:
+    """Writes the output rows into the Results, MultiMarked and Errors sinks.
+
+    Rows are buffered and all the sinks are flushed together every `batch_size`
+    rows. With a manifest, the written input files are checkpointed after each flush.
+    """
+
+    def __init__(
+        self, files_map, columns, batch_size=100, results_format="csv", manifest=None
+    ):
+        results_sink = RESULTS_SINKS[results_format]
+        self.sinks = {
+            file_key: results_sink(file_path, columns)
+            for file_key, file_path in files_map.items()
+        }
+        self.batch_size = batch_size
+        self.pending_rows = 0
+        self.manifest = manifest
+        if manifest is not None:
+            if not results_sink.supports_checkpoints:
+                raise Exception(
+                    f"Resuming is not supported for the '{results_format}' results format"
+                )
+            # Note: checkpoint the newly created files with their headers
+            self.checkpoint()
+
+    def write_row(self, file_key, row, input_path=None):
+        self.sinks[file_key].write_row(row)
+        if self.manifest is not None and input_path is not None:
+            self.manifest.add_file(input_path, file_key)
+        self.pending_rows += 1
+        if self.pending_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for sink in self.sinks.values():
+            sink.flush()
+        self.pending_rows = 0
+        if self.manifest is not None:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.manifest.checkpoint(
+            {str(sink.file_path): sink.get_size() for sink in self.sinks.values()}
+        )
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks.values():
+            sink.close()
+        if self.manifest is not None:
+            self.manifest.close()
+
+
+class AsyncResultsWriter:
+    """Writes the rows of a ResultsWriter from a background thread.
+
+    At most `queue_size` rows wait in the queue, writing blocks beyond that.
+    """
+
+    def __init__(self, results_writer, queue_size=100):
+        self.results_writer = results_writer
+        self.queue = Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = Thread(target=self.write_rows, daemon=True)
+        self.thread.start()
+
+    def write_rows(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Drain the queue after a failure
+                continue
+            try:
+                self.results_writer.write_row(*item)
+            except Exception as error:
+                self.error = error
+
+    def write_row(self, file_key, row, input_path=None):
+        self.queue.put((file_key, row, input_path))
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.results_writer.close()
+        if self.error is not None:
+            raise self.error
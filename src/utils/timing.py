@@ -0,0 +1,140 @@
+import csv
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+from rich.table import Table
+
+from src.logger import console
+
+PERCENTILES = [50, 90, 99]
+
+
+class StageTimings:
+    """Records the per-sheet durations of the processing stages.
+
+    A stage measured more than once for a sheet adds up into the sheet's duration.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # [(file_id, {stage: seconds})] of the finished sheets
+        self.sheet_timings = []
+        self.current_sheet = None
+        self.lap_start = perf_counter()
+
+    def start_sheet(self, file_id, timings=None):
+        self.current_sheet = (file_id, defaultdict(float, timings or {}))
+
+    def end_sheet(self):
+        """Returns the timings of the current sheet"""
+        if self.current_sheet is None:
+            return {}
+        file_id, timings = self.current_sheet
+        self.sheet_timings.append((file_id, dict(timings)))
+        self.current_sheet = None
+        return dict(timings)
+
+    def add(self, stage, seconds):
+        if self.current_sheet is not None:
+            self.current_sheet[1][stage] += seconds
+
+    def start_lap(self):
+        self.lap_start = perf_counter()
+
+    def lap(self, stage):
+        """Adds the time since the previous lap to the stage, for sequential stages"""
+        lap_end = perf_counter()
+        self.add(stage, lap_end - self.lap_start)
+        self.lap_start = lap_end
+
+    @contextmanager
+    def measure(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start)
+
+    def get_summary(self, start_index=0):
+        """Returns {stage: statistics in milliseconds} over the sheets from start_index"""
+        stage_durations = defaultdict(list)
+        for _file_id, timings in self.sheet_timings[start_index:]:
+            for stage, seconds in timings.items():
+                stage_durations[stage].append(seconds)
+        summary = {}
+        for stage, durations in stage_durations.items():
+            durations_ms = np.array(durations) * 1000
+            summary[stage] = {
+                "sheets": len(durations),
+                "total": float(durations_ms.sum()),
+                "mean": float(durations_ms.mean()),
+                **{
+                    f"p{percentile}": float(value)
+                    for percentile, value in zip(
+                        PERCENTILES, np.percentile(durations_ms, PERCENTILES)
+                    )
+                },
+                "max": float(durations_ms.max()),
+            }
+        return summary
+
+    def print_summary(self, start_index=0):
+        summary = self.get_summary(start_index)
+        if not summary:
+            return
+
+        table = Table(title="Stage Timings (ms)", show_lines=False)
+        table.add_column("Stage", style="cyan", no_wrap=True)
+        table.add_column("Sheets", justify="right")
+        table.add_column("Total (s)", justify="right")
+        table.add_column("Mean", justify="right")
+        for percentile in PERCENTILES:
+            table.add_column(f"p{percentile}", justify="right")
+        table.add_column("Max", justify="right", style="magenta")
+        for stage, statistics in summary.items():
+            table.add_row(
+                stage,
+                f"{statistics['sheets']}",
+                f"{round(statistics['total'] / 1000, 2)}",
+                f"{round(statistics['mean'], 1)}",
+                *[
+                    f"{round(statistics[f'p{percentile}'], 1)}"
+                    for percentile in PERCENTILES
+                ],
+                f"{round(statistics['max'], 1)}",
+            )
+        console.print(table, justify="center")
+
+    def dump(self, file_path):
+        """Writes the raw per-sheet timings (in seconds) as a json or csv file"""
+        file_path = str(file_path)
+        if file_path.endswith(".csv"):
+            stages = list(
+                dict.fromkeys(
+                    stage for _, timings in self.sheet_timings for stage in timings
+                )
+            )
+            with open(file_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["file_id"] + stages)
+                for file_id, timings in self.sheet_timings:
+                    writer.writerow([file_id] + [timings.get(s, 0) for s in stages])
+        else:
+            with open(file_path, "w") as f:
+                json.dump(
+                    [
+                        {"file_id": file_id, "timings": timings}
+                        for file_id, timings in self.sheet_timings
+                    ],
+                    f,
+                    indent=2,
+                )
+
+
+# Singleton export
+STAGE_TIMINGS = StageTimings()